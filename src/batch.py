@@ -0,0 +1,124 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import fetch
+import client
+
+# Functions for fetching the weather of many locations at once
+
+WORKERS = 8
+
+# OpenWeather's free plan allows 60 calls per minute
+REQUESTS_PER_MINUTE = 60
+
+
+class RateLimiter:
+    """
+    Space calls out evenly so no more than per_minute of them start in any
+    minute. Safe to share between threads
+    """
+
+    def __init__(self, per_minute=REQUESTS_PER_MINUTE, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.interval = 60.0 / per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def acquire(self):
+        """Wait until the next call is allowed to start"""
+        with self.lock:
+            now = self.clock()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            self.sleep(start - now)
+
+
+def parse_location(text):
+    """
+    Turn a location entered by the user into the query parameters for the
+    current weather endpoint. 'id:2643743' is a city ID from the city list, a
+    five digit number (optionally followed by ',country') is a zip code and
+    anything else is a city name
+    """
+    text = text.strip()
+    if text.lower().startswith("id:"):
+        return {"id": text[3:].strip()}
+
+    code, _, country = text.partition(",")
+    if code.isdigit() and len(code) == 5:
+        return {"zip": f"{code},{country.strip() or 'us'}"}
+    return {"q": text}
+
+
+def read_locations(filename):
+    """Read one location per line from a file, skipping blanks and # comments"""
+    locations = []
+    with open(filename, 'r', encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                locations.append(line)
+    return locations
+
+
+def fetch_location(settings, location, endpoint="weather"):
+    """
+    Fetch the current weather as an Observation, or the forecast as a (city,
+    slots) pair, for one location
+    """
+    if endpoint == "forecast":
+        return fetch.request_forecast(settings, parse_location(location))
+    return fetch.request_weather(settings, parse_location(location))
+
+
+def run_batch(settings, locations, workers=WORKERS,
+              requests_per_minute=REQUESTS_PER_MINUTE, endpoint="weather"):
+    """
+    Fetch the current weather (or the forecast, if endpoint is 'forecast')
+    for every location using a pool of worker threads, staying within
+    requests_per_minute. City IDs asked for current weather are packed into
+    group requests of up to fetch.GROUP_SIZE. Yield (location, data) pairs as
+    each request finishes; data is an Observation, a (city, slots) pair for
+    forecasts, or None if the request failed
+    """
+    by_id = {}
+    others = []
+    for location in locations:
+        params = parse_location(location)
+        if endpoint == "weather" and "id" in params and params["id"].isdigit():
+            by_id.setdefault(int(params["id"]), []).append(location)
+        else:
+            others.append(location)
+
+    weather_client = client.get_client(settings)
+    weather_client.limiter = RateLimiter(requests_per_minute)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(fetch_location, settings, location, endpoint): location
+                       for location in others}
+            groups = {}
+            city_ids = list(by_id)
+            for i in range(0, len(city_ids), fetch.GROUP_SIZE):
+                chunk = city_ids[i:i + fetch.GROUP_SIZE]
+                groups[executor.submit(fetch.request_group, settings, chunk)] = chunk
+
+            for future in as_completed([*futures, *groups]):
+                if future in futures:
+                    yield futures[future], future.result()
+                    continue
+                results = future.result()
+                for city_id in groups[future]:
+                    for location in by_id[city_id]:
+                        yield location, results.get(city_id)
+    finally:
+        weather_client.limiter = None
+
+
+if __name__ == '__main__':
+    import cli
+    sys.exit(cli.main(["batch", *sys.argv[1:]]))
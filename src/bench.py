@@ -0,0 +1,707 @@
+import argparse
+import gc
+import heapq
+import math
+import time
+import tracemalloc
+
+import forecast_store
+import helpers
+import models
+
+# Benchmarks for CLI-Mate's data processing. Run with: python bench.py <name>
+
+
+def sample_slot(dt):
+    """Return one forecast entry shaped like the data returned by the API"""
+    return {
+        "dt": dt,
+        "main": {"temp": 51.3, "feels_like": 49.8, "temp_min": 50.1,
+                 "temp_max": 52.6, "pressure": 1016, "sea_level": 1016,
+                 "grnd_level": 1012, "humidity": 71, "temp_kf": 0.7},
+        "weather": [{"id": 500, "main": "Rain", "description": "light rain",
+                     "icon": "10d"}],
+        "clouds": {"all": 75},
+        "wind": {"speed": 8.1, "deg": 203, "gust": 14.2},
+        "visibility": 10000,
+        "pop": 0.4,
+        "rain": {"3h": 0.62},
+        "sys": {"pod": "d"},
+        "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(dt)),
+    }
+
+
+def sample_forecast(start=1_700_000_000, slots=40):
+    """Return a forecast response with slots 3 hour entries starting at start"""
+    return {
+        "cod": "200", "message": 0, "cnt": slots,
+        "list": [sample_slot(start + i * 3 * 60 * 60) for i in range(slots)],
+        "city": {"id": 5128581, "name": "New York",
+                 "coord": {"lat": 40.7143, "lon": -74.006}, "country": "US",
+                 "population": 8175133, "timezone": -14400,
+                 "sunrise": 1_699_961_000, "sunset": 1_699_997_000},
+    }
+
+
+def mock_fixture(name):
+    """Load one of the responses recorded for the mock server"""
+    import mock_server
+
+    return mock_server.load_fixture(name)
+
+
+def measure(function, repeat=1):
+    """
+    Call function repeat times and return the seconds taken, then call it once
+    more while tracing allocations and return the peak memory it allocated,
+    along with the last result
+    """
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def report(name, elapsed, peak, count, unit="records"):
+    """Print one line of benchmark results. peak is left out if it is None"""
+    rate = count / elapsed if elapsed else float("inf")
+    line = f"{name:<32} {elapsed * 1000:9.1f} ms  {rate:12,.0f} {unit}/s"
+    if peak is not None:
+        line += f"  peak {peak / 1024:10,.0f} KiB"
+    print(line)
+
+
+def _dict_fields(data):
+    """Walk a raw entry the way the renderer used to"""
+    main = data['main']
+    rain = data.get('rain')
+    rainfall = (rain.get('1h') or rain.get('3h')) if rain else None
+    return (data['weather'][0]['description'], data['clouds']['all'],
+            main['temp'], main['feels_like'], main['temp_max'] - main['temp'],
+            main['temp'] - main['temp_min'], main['humidity'], rainfall,
+            data.get('visibility'), data['wind']['speed'], data['wind']['deg'],
+            data['dt'])
+
+
+def _record_fields(record):
+    """Read the same fields from a parsed record"""
+    return (record.description, record.clouds, record.temp, record.feels_like,
+            record.temp_max - record.temp, record.temp - record.temp_min,
+            record.humidity, record.rain, record.visibility, record.wind_speed,
+            record.wind_deg, record.dt)
+
+
+def bench_models(locations=1000):
+    """
+    Compare keeping every forecast response as raw dictionaries with parsing
+    them into slotted records. The raw payloads are built from JSON text so
+    both sides start from freshly decoded data, as they would after a fetch
+    """
+    import json
+
+    payload = json.dumps(sample_forecast())
+    count = locations * 40
+
+    elapsed, peak, responses = measure(
+        lambda: [json.loads(payload)['list'] for _ in range(locations)])
+    report("decode, keep dicts", elapsed, peak, count)
+
+    elapsed, peak, forecasts = measure(
+        lambda: [models.parse_forecast(json.loads(payload))[1] for _ in range(locations)])
+    report("decode, parse to records", elapsed, peak, count)
+
+    elapsed, peak, _ = measure(
+        lambda: [_dict_fields(data) for slots in responses for data in slots], 5)
+    report("read fields from dicts x5", elapsed, peak, count * 5)
+
+    elapsed, peak, _ = measure(
+        lambda: [_record_fields(record) for slots in forecasts for record in slots], 5)
+    report("read fields from records x5", elapsed, peak, count * 5)
+
+
+def _dates_by_datetime(slots):
+    """Find the distinct dates of the slots the way refine_date used to"""
+    from datetime import datetime
+
+    choice_list = []
+    for slot in slots:
+        day = datetime.fromtimestamp(slot.dt).date()
+        if day not in choice_list:
+            choice_list.append(day)
+    return [[slot for slot in slots if datetime.fromtimestamp(slot.dt).date() == day]
+            for day in choice_list]
+
+
+def bench_forecast_store(locations=2000):
+    """
+    Bucket the forecasts of many locations by day, first with a datetime per
+    slot as refine_date used to, then with the column store, which also
+    produces a summary of every day
+    """
+    city, slots = models.parse_forecast(sample_forecast())
+    count = locations * len(slots)
+
+    elapsed, peak, _ = measure(
+        lambda: [_dates_by_datetime(slots) for _ in range(locations)])
+    report("datetime per slot, group by day", elapsed, peak, count, "slots")
+
+    def build_and_summarise():
+        store = forecast_store.ForecastStore()
+        for i in range(locations):
+            store.add(str(i), slots)
+        return store.daily_summaries()
+
+    elapsed, peak, summaries = measure(build_and_summarise)
+    report("column store, daily summaries", elapsed, peak, count, "slots")
+
+
+def _wind_direction_by_search(wind_degree):
+    """The dictionary search calculate_wind_direction used to do, kept to check against"""
+    wind_direction_dict = {'N': 0, 'NNE': 22.5, 'NE': 45, 'ENE': 67.5, 'E': 90,
+                           'ESE': 112.5, 'SE': 135, 'SSE': 157.5, 'S': 180,
+                           'SSW': 202.5, 'SW': 225, 'WSW': 247.5, 'W': 270,
+                           'WNW': 292.5, 'NW': 315, 'NNW': 337.5, 'N2': 360}
+    wind_degree = wind_degree % 360
+    min_key = max_key = None
+    for k, v in wind_direction_dict.items():
+        if wind_degree >= v:
+            min_key = k
+        else:
+            max_key = k
+            break
+    if wind_degree - wind_direction_dict[min_key] < wind_direction_dict[max_key] - wind_degree:
+        direction = min_key
+    else:
+        direction = max_key
+    return 'N' if direction == 'N2' else direction
+
+
+def bench_wind(steps=3600):
+    """
+    Check that the compass lookup agrees with the old dictionary search for
+    every tenth of a degree from -360 to 360, then time both
+    """
+    degrees = [i / 10 for i in range(-steps, steps + 1)]
+    expected = [_wind_direction_by_search(degree) for degree in degrees]
+    if helpers.wind_directions(degrees) != expected:
+        raise AssertionError("wind_directions disagrees with the dictionary search")
+    if [helpers.calculate_wind_direction(degree) for degree in degrees] != expected:
+        raise AssertionError("calculate_wind_direction disagrees with the dictionary search")
+    print(f"{len(degrees):,} directions agree with the dictionary search")
+
+    elapsed, peak, _ = measure(
+        lambda: [_wind_direction_by_search(degree) for degree in degrees], 5)
+    report("dictionary search", elapsed, peak, len(degrees) * 5, "directions")
+
+    elapsed, peak, _ = measure(
+        lambda: [helpers.calculate_wind_direction(degree) for degree in degrees], 5)
+    report("sector lookup", elapsed, peak, len(degrees) * 5, "directions")
+
+    elapsed, peak, _ = measure(lambda: helpers.wind_directions(degrees), 5)
+    report("bulk sector lookup", elapsed, peak, len(degrees) * 5, "directions")
+
+
+def _print_weather_per_line(records, name=""):
+    """The print per line renderer print_weather used to be, kept to compare against"""
+    from datetime import datetime
+
+    import timezones
+
+    for record in records:
+        min_var = record.temp - record.temp_min
+        max_var = record.temp_max - record.temp
+        local = timezones.local_times([record])[0]
+        readable_sunrise = local.sunrise
+        readable_sunset = local.sunset
+        readable_time_of_calc = datetime.fromtimestamp(record.dt)
+        city_name = getattr(record, "name", "") or name
+
+        print(f"\nWEATHER for {city_name.upper()} - {readable_time_of_calc}")
+        print("-" * 29)
+        print(f"Date: {datetime.today().date()}")
+        print(f"Description: {record.description}")
+        print(f"Current Temperature: {record.temp}")
+        print(f"Feels Like: {record.feels_like}")
+        print(f"Temperature Variance: +{round(max_var, 1)}, -{round(min_var, 1)}")
+        print(f"Humidity: {record.humidity}%")
+        print(f"Wind Speed: {record.wind_speed}mph")
+        print(f"Wind Direction: {helpers.calculate_wind_direction(record.wind_deg)}")
+        if record.rain:
+            print(f"Rainfall: {record.rain}mm/h")
+        if record.snow:
+            print(f"Snowfall: {record.snow}mm/h")
+        print(f"Cloud Coverage: {record.clouds}%")
+        if record.visibility:
+            print(f"Visibility: {record.visibility/1000.0}km")
+        if readable_sunrise:
+            print(f"Sunrise: {readable_sunrise}")
+        if readable_sunset:
+            print(f"Sunset: {readable_sunset}")
+        print("-" * 29)
+
+
+def bench_render(repeat=50):
+    """
+    Render a full forecast to a file with the print per line renderer and
+    with each layout of the compiled renderer
+    """
+    import contextlib
+    import os
+
+    import render
+
+    city, slots = models.parse_forecast(mock_fixture('forecast.json'))
+    count = len(slots) * repeat
+
+    with open(os.devnull, 'w', encoding="utf-8") as devnull:
+        def per_line():
+            with contextlib.redirect_stdout(devnull):
+                for _ in range(repeat):
+                    _print_weather_per_line(slots, city.name)
+        elapsed, peak, _ = measure(per_line)
+        report("print per line", elapsed, peak, count)
+
+        for layout in render.LAYOUTS:
+            renderer = render.Renderer(layout)
+            elapsed, peak, _ = measure(
+                lambda: [renderer.write(slots, devnull, city.name) for _ in range(repeat)])
+            report(f"compiled, {layout}", elapsed, peak, count)
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at fraction (0 to 1) of the way through sorted_values"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def report_latencies(name, latencies, elapsed, peak):
+    """Print the latency percentiles, throughput and peak memory of a workload"""
+    latencies = sorted(latencies)
+    rate = len(latencies) / elapsed if elapsed else float("inf")
+    print(f"{name:<10} {len(latencies):6} ops  "
+          f"p50 {percentile(latencies, 0.50) * 1000:7.2f} ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:7.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms  "
+          f"{rate:8,.1f} ops/s  peak {peak / 1024:8,.0f} KiB")
+
+
+def run_workload(operation, count):
+    """Run operation count times, returning each call's latency and the total time"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        op_start = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - op_start)
+    return latencies, time.perf_counter() - start
+
+
+def sample_city(i):
+    """Return one entry shaped like those in OpenWeather's city list"""
+    return {"id": 1_000_000 + i, "name": f"City {i:06d}", "state": "",
+            "country": "US", "coord": {"lon": -74.006 + i / 10000, "lat": 40.7143}}
+
+
+def write_city_list(filename, cities):
+    """Write a city list of the given size, one entry at a time"""
+    import json
+
+    with open(filename, 'w', encoding="utf-8") as f:
+        f.write("[\n")
+        for i in range(cities):
+            f.write(("," if i else "") + json.dumps(sample_city(i), indent=2) + "\n")
+        f.write("]\n")
+
+
+def bench_stream(cities=200_000):
+    """
+    Compare decoding a large city list whole with reading it one city at a
+    time, and the same for a forecast response. Peak memory of the streaming
+    reader should not grow with the size of the file
+    """
+    import json
+    import os
+    import tempfile
+
+    import city_index
+    import stream
+
+    workdir = tempfile.mkdtemp()
+    source_file = os.path.join(workdir, 'city.list.json')
+    index_file = os.path.join(workdir, 'city.index.db')
+    try:
+        write_city_list(source_file, cities)
+        print(f"{cities:,} cities, {os.path.getsize(source_file) / 2 ** 20:,.1f} MiB")
+
+        def load_whole():
+            with open(source_file, 'r', encoding="utf-8") as f:
+                return len(json.load(f))
+
+        elapsed, peak, _ = measure(load_whole)
+        report("json.load whole list", elapsed, peak, cities)
+
+        elapsed, peak, _ = measure(
+            lambda: sum(1 for _ in stream.iter_file_array(source_file)))
+        report("stream every city", elapsed, peak, cities)
+
+        def find_first(name):
+            for city in stream.iter_file_array(source_file):
+                if city["name"] == name:
+                    return city
+
+        elapsed, peak, _ = measure(lambda: find_first("City 000100"), 10)
+        report("stream, stop at 101st x10", elapsed, peak, 101 * 10)
+
+        elapsed, peak, _ = measure(
+            lambda: city_index.build_index(source_file, index_file))
+        report("build index from stream", elapsed, peak, cities)
+    finally:
+        city_index.close_index(index_file)
+        for filename in os.listdir(workdir):
+            os.remove(os.path.join(workdir, filename))
+        os.rmdir(workdir)
+
+    payload = json.dumps(sample_forecast())
+    elapsed, peak, _ = measure(lambda: models.parse_forecast(json.loads(payload)), 1000)
+    report("forecast, decode then parse x1000", elapsed, peak, 40 * 1000)
+
+    chunks = [payload[i:i + 8192] for i in range(0, len(payload), 8192)]
+    elapsed, peak, _ = measure(lambda: models.parse_forecast_stream(chunks), 1000)
+    report("forecast, stream parse x1000", elapsed, peak, 40 * 1000)
+
+
+def bench_index(cities=200_000):
+    """
+    Build the city index from a large city list in one process, then with
+    pools of worker processes of growing size
+    """
+    import os
+    import tempfile
+
+    import city_index
+
+    workdir = tempfile.mkdtemp()
+    source_file = os.path.join(workdir, 'city.list.json')
+    index_file = os.path.join(workdir, 'city.index.db')
+    try:
+        write_city_list(source_file, cities)
+        print(f"{cities:,} cities, {os.cpu_count()} cores")
+
+        # Peak memory is left out, since tracemalloc cannot see the workers
+        start = time.perf_counter()
+        city_index.build_index(source_file, index_file)
+        report("single process", time.perf_counter() - start, None, cities, "cities")
+
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            start = time.perf_counter()
+            city_index.build_index_parallel(source_file, index_file, workers)
+            report(f"{workers} worker processes", time.perf_counter() - start, None,
+                   cities, "cities")
+            workers *= 2
+    finally:
+        city_index.close_index(index_file)
+        for filename in os.listdir(workdir):
+            os.remove(os.path.join(workdir, filename))
+        os.rmdir(workdir)
+
+
+def _nearest_by_scan(cities, lat, lon, k):
+    """Find the k nearest cities by measuring the distance to every city"""
+    import geo
+
+    return heapq.nsmallest(k, ((geo.haversine(lat, lon, city["coord"]["lat"],
+                                              city["coord"]["lon"]), city["id"])
+                               for city in cities))
+
+
+def bench_geo(cities=200_000, queries=1000, scans=20):
+    """
+    Answer nearest city and radius queries with the k-d tree and compare the
+    nearest city queries with a linear haversine scan, checking that both
+    find the same cities
+    """
+    import random
+
+    import geo
+
+    rng = random.Random(0)
+    city_list = [{"id": i, "name": f"City {i:06d}", "country": "US",
+                  "coord": {"lat": math.degrees(math.asin(rng.uniform(-1, 1))),
+                            "lon": rng.uniform(-180, 180)}}
+                 for i in range(cities)]
+    points = [(math.degrees(math.asin(rng.uniform(-1, 1))), rng.uniform(-180, 180))
+              for _ in range(queries)]
+
+    elapsed, peak, geo_index = measure(lambda: geo.GeoIndex(city_list))
+    report("build k-d tree", elapsed, peak, cities, "cities")
+
+    elapsed, peak, _ = measure(lambda: [geo_index.nearest(lat, lon, 5) for lat, lon in points])
+    report("5 nearest, k-d tree", elapsed, peak, queries, "queries")
+
+    elapsed, peak, scanned = measure(
+        lambda: [_nearest_by_scan(city_list, lat, lon, 5) for lat, lon in points[:scans]])
+    report("5 nearest, haversine scan", elapsed, peak, scans, "queries")
+
+    for (lat, lon), expected in zip(points, scanned):
+        found = [city["id"] for _, city in geo_index.nearest(lat, lon, 5)]
+        if found != [city_id for _, city_id in expected]:
+            raise AssertionError(f"k-d tree and scan disagree at {lat}, {lon}")
+
+    elapsed, peak, found = measure(lambda: [geo_index.within(lat, lon, 100) for lat, lon in points])
+    report("within 100km, k-d tree", elapsed, peak, queries, "queries")
+    print(f"{sum(map(len, found)) / queries:.1f} cities within 100km on average")
+
+
+def bench_snapshot(locations=5000, lookups=10_000):
+    """
+    Export the weather and forecast of many locations to a snapshot, then open
+    it and look random locations up, as the offline mode does
+    """
+    import dataclasses
+    import os
+    import random
+    import tempfile
+
+    import snapshot
+
+    weather = models.parse_observation(mock_fixture('weather.json'))
+    city, slots = models.parse_forecast(mock_fixture('forecast.json'))
+    workdir = tempfile.mkdtemp()
+    filename = os.path.join(workdir, 'weather.snapshot')
+
+    def export():
+        with snapshot.SnapshotWriter(filename) as writer:
+            for i in range(locations):
+                writer.add_weather({"id": i}, dataclasses.replace(weather, city_id=i))
+                writer.add_forecast({"zip": f"{i:05},us"}, city, slots)
+
+    try:
+        elapsed, peak, _ = measure(export)
+        report("export", elapsed, peak, locations, "locations")
+        print(f"{os.path.getsize(filename) / locations:,.0f} bytes per location")
+
+        elapsed, peak, saved = measure(lambda: snapshot.Snapshot(filename))
+        report("open", elapsed, peak, locations, "locations")
+
+        rng = random.Random(0)
+        ids = [rng.randrange(locations) for _ in range(lookups)]
+        elapsed, peak, _ = measure(lambda: [saved.weather({"id": i}) for i in ids])
+        report("weather lookups", elapsed, peak, lookups, "lookups")
+        elapsed, peak, _ = measure(
+            lambda: [saved.forecast({"zip": f"{i:05},us"}) for i in ids])
+        report("forecast lookups", elapsed, peak, lookups, "lookups")
+        saved.close()
+    finally:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+
+def bench_profiling(calls=1_000_000):
+    """
+    Measure what a timed stage costs with timing turned off and on, against
+    the same loop with nothing timed
+    """
+    import profiling
+
+    def bare():
+        for _ in range(calls):
+            pass
+
+    def staged():
+        stage = profiling.stage
+        for _ in range(calls):
+            with stage("parse"):
+                pass
+
+    elapsed, _, _ = measure(bare)
+    report("no stage", elapsed, None, calls, "calls")
+    elapsed, _, _ = measure(staged)
+    report("stage, timing off", elapsed, None, calls, "calls")
+
+    enabled = profiling.enabled
+    profiling.enabled = True
+    try:
+        elapsed, _, _ = measure(staged)
+    finally:
+        profiling.enabled = enabled
+        profiling.stage_seconds.clear()
+        profiling.stage_calls.clear()
+    report("stage, timing on", elapsed, None, calls, "calls")
+
+
+def bench_conditional(count=200, latency=0.002):
+    """
+    Fetch the forecast from the mock server again and again: uncompressed,
+    gzipped, limited to 8 slots with cnt, and revalidated with the cached
+    ETag so the server answers 304. Reports the bytes each request moved and
+    the time spent decoding
+    """
+    import cache
+    import client
+    import fetch
+    import mock_server
+    import profiling
+
+    variants = (
+        ("full, identity", dict(compress=False), True, None),
+        ("full, gzip", {}, True, None),
+        ("cnt=8, gzip", {}, True, 8),
+        ("revalidate, 304", {}, False, None),
+    )
+
+    shared_cache = cache._cache
+    ttl = cache.TTLS["forecast"]
+    enabled = profiling.enabled
+    profiling.enabled = True
+    try:
+        for name, options, fresh, slots in variants:
+            api = mock_server.MockAPI(latency=latency, **options)
+            with mock_server.MockServer(api) as server:
+                # Nothing is ever fresh, so each request after the first is
+                # conditional unless the cache is turned off
+                cache._cache = cache.ResponseCache(persistent=False)
+                cache.TTLS["forecast"] = 0
+                settings = {"API_KEY": "bench", "zip_code": "10001", "use_cache": not fresh,
+                            "record_history": False, "base_url": server.base_url}
+                client.close_client()
+                params = fetch.zip_params(settings)
+                fetch.request_forecast(settings, params, slots)
+
+                api.bytes_sent = 0
+                profiling.stage_seconds.clear()
+                profiling.stage_calls.clear()
+                latencies, elapsed = run_workload(
+                    lambda: fetch.request_forecast(settings, params, slots), count)
+                latencies.sort()
+                print(f"{name:<18} p50 {percentile(latencies, 0.50) * 1000:6.2f} ms  "
+                      f"{api.bytes_sent / count:8,.0f} body bytes/op  "
+                      f"decode {profiling.stage_seconds['decode'] * 1000 / count:6.3f} ms/op  "
+                      f"{count / elapsed:7,.1f} ops/s")
+    finally:
+        cache._cache = shared_cache
+        cache.TTLS["forecast"] = ttl
+        profiling.enabled = enabled
+        profiling.stage_seconds.clear()
+        profiling.stage_calls.clear()
+        profiling.counters.clear()
+        client.close_client()
+
+
+def bench_e2e(count=200, locations=100, latency=0.002):
+    """
+    Drive the fetch, parse and render path against the local mock server for
+    single observations, forecasts, cities and batches. Nothing is cached, so
+    every operation makes a request
+    """
+    import contextlib
+    import io
+    import os
+    import shutil
+    import tempfile
+
+    import batch
+    import client
+    import fetch
+    import mock_server
+    import ui_helpers
+
+    sink = io.StringIO()
+
+    def render(records, name=""):
+        sink.seek(0)
+        sink.truncate()
+        with contextlib.redirect_stdout(sink):
+            ui_helpers.print_weather(records, name)
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    server = mock_server.MockServer(mock_server.MockAPI(latency=latency))
+    try:
+        shutil.copy(os.path.join(mock_server.FIXTURE_DIR, 'city.list.json'), workdir)
+        os.chdir(workdir)
+        server.start()
+        settings = {"API_KEY": "bench", "zip_code": "10001",
+                    "base_url": server.base_url, "use_cache": False}
+        client.close_client()
+        client.get_client(settings)
+
+        def single():
+            render([fetch.request_weather(settings, fetch.zip_params(settings))])
+
+        def forecast():
+            city, slots = fetch.request_forecast(settings, fetch.zip_params(settings))
+            day = helpers.filter_by_date(slots, forecast_store.ForecastStore.from_slots(slots).dates()[1])
+            render(day, city.name)
+
+        def city():
+            city_choice_dict = helpers.same_name_cities("Paris")[0]
+            render([fetch.request_weather(settings,
+                                          fetch.city_params("Paris", city_choice_dict))])
+
+        def run_batch():
+            names = ["10001", "London", "Paris", "id:2950159", "Tokyo"]
+            chosen = [names[i % len(names)] for i in range(locations)]
+            for _, data in batch.run_batch(settings, chosen, requests_per_minute=1_000_000):
+                render([data])
+
+        for name, operation, runs in (("single", single, count),
+                                      ("forecast", forecast, count),
+                                      ("city", city, count)):
+            latencies, elapsed = run_workload(operation, runs)
+            _, peak, _ = measure(operation)
+            report_latencies(name, latencies, elapsed, peak)
+
+        weather_client = client.get_client()
+        weather_client.latencies.clear()
+        _, elapsed = run_workload(run_batch, 1)
+        request_latencies = [seconds for _, _, seconds in weather_client.latencies]
+        _, peak, _ = measure(run_batch)
+        report_latencies("batch", request_latencies, elapsed, peak)
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        client.close_client()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+BENCHMARKS = {
+    "models": bench_models,
+    "forecast": bench_forecast_store,
+    "wind": bench_wind,
+    "render": bench_render,
+    "stream": bench_stream,
+    "index": bench_index,
+    "geo": bench_geo,
+    "snapshot": bench_snapshot,
+    "profiling": bench_profiling,
+    "conditional": bench_conditional,
+    "e2e": bench_e2e,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run CLI-Mate benchmarks")
+    parser.add_argument("names", nargs="*", choices=[[], *BENCHMARKS],
+                        help="benchmarks to run (default: all)")
+    args = parser.parse_args(argv)
+
+    for name in args.names or BENCHMARKS:
+        print(f"\n{name}")
+        print("-" * 29)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import profiling
+
+# Functions related to caching responses from the OpenWeather API
+
+CACHE_FILE = 'weather_cache.db'
+MAX_ENTRIES = 256
+
+# How long a response stays fresh, in seconds. Current weather is updated
+# every 10 minutes and the forecast is given in 3 hour slots
+TTLS = {"weather": 10 * 60, "forecast": 3 * 60 * 60}
+DEFAULT_TTL = 10 * 60
+
+# A current weather report whose next update is due any moment is still kept
+# this long, so the update is not asked for on every lookup
+MIN_TTL = 60
+
+# Query parameters that do not change the data returned by the API
+IGNORED_PARAMS = {"appid"}
+
+
+def make_key(endpoint, params):
+    """
+    Build a cache key from an endpoint and its query parameters. Parameters
+    are sorted and their values stripped and lower cased so the same request
+    always produces the same key. The API key is left out so it is never
+    written to disk
+    """
+    items = sorted((k, str(v).strip().lower()) for k, v in params.items()
+                   if k not in IGNORED_PARAMS)
+    query = "&".join(f"{k}={v}" for k, v in items)
+    return f"{endpoint}?{query}"
+
+
+def ttl_for(endpoint, data=None, now=None):
+    """
+    Return the time to live for a response from an endpoint. A current weather
+    report is only kept until the next update is due, counted from the time
+    it was calculated rather than the time it was fetched. Reports are often
+    published late, so once that update is overdue the report is kept for the
+    whole interval from now, as any other response is
+    """
+    ttl = TTLS.get(endpoint, DEFAULT_TTL)
+    if endpoint == "weather" and data and "dt" in data:
+        now = time.time() if now is None else now
+        due = data["dt"] + ttl
+        if due > now:
+            ttl = max(MIN_TTL, due - now)
+    return ttl
+
+
+class MemoryCache:
+    """A bounded, least recently used cache whose entries expire"""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key, now=None):
+        """Return the value stored under key, or None if it is missing or stale"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= (time.time() if now is None else now):
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, expires):
+        """Store value under key until the unix time expires"""
+        self.entries[key] = (expires, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        """Remove the entry stored under key, if there is one"""
+        self.entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry"""
+        self.entries.clear()
+
+
+class DiskCache:
+    """A cache stored in a SQLite file so responses outlive the process"""
+
+    def __init__(self, filename=CACHE_FILE):
+        self.filename = filename
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.filename, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, expires REAL, data TEXT)")
+        return self.conn
+
+    def get(self, key, now=None):
+        """Return the value and expiry stored under key, or None if missing or stale"""
+        conn = self._connect()
+        row = conn.execute("SELECT expires, data FROM responses WHERE key = ?",
+                           (key,)).fetchone()
+        if row is None:
+            return None
+        expires, data = row
+        if expires <= (time.time() if now is None else now):
+            return None
+        return expires, json.loads(data)
+
+    def put(self, key, value, expires):
+        """Store value under key until the unix time expires"""
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                         (key, expires, json.dumps(value)))
+            conn.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+
+    def discard(self, key):
+        """Remove the entry stored under key, if there is one"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        """Remove every entry"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM responses")
+
+
+class ResponseCache:
+    """
+    A two tier cache for API responses. Lookups check the in memory tier first
+    and fall back to the optional on disk tier. Safe to share between threads
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, filename=CACHE_FILE, persistent=True):
+        self.memory = MemoryCache(max_entries)
+        self.disk = DiskCache(filename) if persistent else None
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the fresh value stored under key, or None"""
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None or self.disk is None:
+                profiling.count("cache", "miss" if value is None else "hit")
+                return value
+
+            entry = self.disk.get(key)
+            if entry is None:
+                profiling.count("cache", "miss")
+                return None
+            expires, value = entry
+            self.memory.put(key, value, expires)
+            profiling.count("cache", "hit")
+            return value
+
+    def put(self, key, value, ttl):
+        """Store value under key for ttl seconds"""
+        expires = time.time() + ttl
+        with self.lock:
+            self.memory.put(key, value, expires)
+            if self.disk is not None:
+                self.disk.put(key, value, expires)
+
+    def discard(self, key):
+        """Remove the entry stored under key from both tiers"""
+        with self.lock:
+            self.memory.discard(key)
+            if self.disk is not None:
+                self.disk.discard(key)
+
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self.lock:
+            self.memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the response cache shared by the whole process. It is created under
+    a lock, so threads that ask for it at the same time all get the same one
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
+
+
+def clear():
+    """Invalidate every cached response"""
+    get_cache().clear()
@@ -0,0 +1,292 @@
+import hashlib
+import itertools
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import search
+import stream
+
+# Functions related to the compiled, on-disk index of OpenWeather's city list
+
+INDEX_FILE = 'city.index.db'
+INDEX_VERSION = 2
+
+# Every record in the city list is an object that starts with its id, which
+# is how shard boundaries are found without parsing what comes before them
+RECORD_START = re.compile(rb'\{\s*"id"\s*:')
+BOUNDARY_SCAN = 64 * 1024
+_SEPARATOR = re.compile(r'[\s,]*')
+
+_connections = {}
+
+# Indexes loaded into memory by load_index, which never touch their file
+_in_memory = set()
+
+
+def file_hash(path):
+    """Return the sha1 hex digest of a file, read in fixed size chunks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_meta(conn):
+    """Return the meta table of an index as a dictionary"""
+    try:
+        rows = conn.execute("SELECT key, value FROM meta").fetchall()
+    except sqlite3.DatabaseError:
+        return {}
+    return dict(rows)
+
+
+def _create_tables(conn):
+    """Create the tables used by the index in a fresh database"""
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("""
+        CREATE TABLE cities (
+            id INTEGER,
+            name TEXT NOT NULL,
+            state TEXT,
+            country TEXT,
+            lat REAL,
+            lon REAL,
+            folded TEXT
+        )""")
+
+
+def _write_meta(conn, source_file, source_hash):
+    """Record the version of the index and the state of the source file"""
+    stat = os.stat(source_file)
+    meta = {
+        "version": str(INDEX_VERSION),
+        "source_mtime": str(stat.st_mtime_ns),
+        "source_size": str(stat.st_size),
+        "source_sha1": source_hash,
+    }
+    conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", meta.items())
+
+
+def city_row(city):
+    """
+    Flatten a city dictionary from the city list into an index row, along
+    with its name folded for the fuzzy search
+    """
+    coord = city.get("coord") or {}
+    return (city.get("id"), city["name"], city.get("state") or None,
+            city.get("country"), coord.get("lat"), coord.get("lon"),
+            search.fold(city["name"]))
+
+
+def row_to_city(row):
+    """Turn an index row back into a dictionary shaped like the city list"""
+    city_id, name, state, country, lat, lon = row
+    return {"id": city_id, "name": name, "state": state or "",
+            "country": country, "coord": {"lon": lon, "lat": lat}}
+
+
+def write_index(rows, source_file, index_file=INDEX_FILE, source_hash=None):
+    """
+    Write rows to a new index next to index_file and move it into place once
+    it is complete, so a reader never sees a partially written index
+    """
+    if source_hash is None:
+        source_hash = file_hash(source_file)
+
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+
+    conn = sqlite3.connect(tmp_file)
+    try:
+        _create_tables(conn)
+        conn.executemany("INSERT INTO cities VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("CREATE INDEX cities_name ON cities (name)")
+        _write_meta(conn, source_file, source_hash)
+        conn.commit()
+    finally:
+        conn.close()
+
+    close_index(index_file)
+    os.replace(tmp_file, index_file)
+
+
+def build_index(source_file, index_file=INDEX_FILE):
+    """
+    Compile the JSON city list into a SQLite index sorted by city name. The
+    list is read one city at a time, so the whole file is never decoded at once
+    """
+    cities = stream.iter_file_array(source_file)
+    write_index((city_row(city) for city in cities), source_file, index_file)
+
+
+def shard_ranges(source_file, shards):
+    """
+    Split the city list into at most shards byte ranges of about the same
+    size. Each range starts at the beginning of a record, so the ranges can
+    be parsed independently
+    """
+    size = os.path.getsize(source_file)
+    starts = []
+    with open(source_file, 'rb') as f:
+        for i in range(shards):
+            offset = size * i // shards
+            f.seek(offset)
+            while True:
+                block = f.read(BOUNDARY_SCAN)
+                match = RECORD_START.search(block)
+                if match or len(block) < BOUNDARY_SCAN:
+                    break
+                # Step back a little so a record start split between two
+                # blocks is still found
+                offset += len(block) - 16
+                f.seek(offset)
+            if match and (not starts or offset + match.start() > starts[-1]):
+                starts.append(offset + match.start())
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def shard_rows(source_file, start, end):
+    """Parse the records between two byte offsets of the city list into index rows"""
+    with open(source_file, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+
+    decoder = json.JSONDecoder()
+    rows = []
+    pos = 0
+    while True:
+        pos = _SEPARATOR.match(text, pos).end()
+        if pos >= len(text) or text[pos] == "]":
+            return rows
+        city, pos = decoder.raw_decode(text, pos)
+        rows.append(city_row(city))
+
+
+def build_index_parallel(source_file, index_file=INDEX_FILE, workers=None):
+    """
+    Compile the city list into the index using a pool of worker processes.
+    The list is split into one shard per worker, each worker parses its shard
+    into index rows, and the rows are written in file order to a new index
+    that replaces the old one once complete. Return the number of cities
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = shard_ranges(source_file, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(shard_rows, source_file, start, end)
+                   for start, end in ranges]
+        # Hash the source while the workers parse it
+        source_hash = file_hash(source_file)
+        shards = [future.result() for future in futures]
+
+    write_index(itertools.chain.from_iterable(shards), source_file, index_file,
+                source_hash)
+    return sum(len(rows) for rows in shards)
+
+
+def is_current(index_file, source_file):
+    """
+    Check whether the index was built from the current version of the source
+    file. The modification time and size are checked first; the file is only
+    hashed when they differ, which lets a touched but unchanged file keep its
+    index
+    """
+    if not os.path.exists(index_file):
+        return False
+
+    conn = sqlite3.connect(index_file)
+    try:
+        meta = _read_meta(conn)
+        if meta.get("version") != str(INDEX_VERSION):
+            return False
+
+        stat = os.stat(source_file)
+        if (meta.get("source_mtime") == str(stat.st_mtime_ns)
+                and meta.get("source_size") == str(stat.st_size)):
+            return True
+
+        if meta.get("source_sha1") != file_hash(source_file):
+            return False
+
+        # The contents are unchanged, so remember the new mtime and size
+        _write_meta(conn, source_file, meta["source_sha1"])
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+def open_index(source_file, index_file=INDEX_FILE):
+    """
+    Return a connection to an up to date index of source_file, building or
+    rebuilding it first if needed. If the source file is missing an existing
+    index is used as is. Raises FileNotFoundError if neither exist.
+    """
+    if index_file in _in_memory:
+        return _connections[index_file]
+    if os.path.exists(source_file):
+        if not is_current(index_file, source_file):
+            build_index(source_file, index_file)
+    elif not os.path.exists(index_file):
+        raise FileNotFoundError(source_file)
+
+    conn = _connections.get(index_file)
+    if conn is None:
+        conn = sqlite3.connect(index_file, check_same_thread=False)
+        _connections[index_file] = conn
+    return conn
+
+
+def close_index(index_file=INDEX_FILE):
+    """Close the cached connection to an index, if there is one"""
+    _in_memory.discard(index_file)
+    conn = _connections.pop(index_file, None)
+    if conn is not None:
+        conn.close()
+
+
+def serialize_index(source_file, index_file=INDEX_FILE):
+    """Return the bytes of an up to date index of source_file"""
+    return open_index(source_file, index_file).serialize()
+
+
+def load_index(data, index_file=INDEX_FILE):
+    """
+    Serve the index stored under index_file from data, the bytes returned by
+    serialize_index, instead of from the file. The index is held in memory and
+    neither the index file nor the city list is read again
+    """
+    close_index(index_file)
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.deserialize(data)
+    _connections[index_file] = conn
+    _in_memory.add(index_file)
+
+
+def lookup_name(source_file, name, index_file=INDEX_FILE):
+    """Return every city in the index with exactly the given name, in file order"""
+    conn = open_index(source_file, index_file)
+    rows = conn.execute(
+        "SELECT id, name, state, country, lat, lon FROM cities "
+        "WHERE name = ? ORDER BY rowid", (name,))
+    return [row_to_city(row) for row in rows]
+
+
+def all_cities(source_file, index_file=INDEX_FILE):
+    """Yield every city in the index as a dictionary, in file order"""
+    conn = open_index(source_file, index_file)
+    rows = conn.execute(
+        "SELECT id, name, state, country, lat, lon FROM cities ORDER BY rowid")
+    for row in rows:
+        yield row_to_city(row)
+
+
+def folded_names(source_file, index_file=INDEX_FILE):
+    """Return the folded name of every city in the index, in file order"""
+    conn = open_index(source_file, index_file)
+    return [folded for folded, in conn.execute(
+        "SELECT folded FROM cities ORDER BY rowid")]
@@ -0,0 +1,482 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import config
+import fetch
+import forecast_store
+import helpers
+import models
+import profiling
+import render
+import search
+import snapshot
+import timezones
+
+# Non-interactive command line interface for scripts and scheduled jobs
+
+FORMATS = ("text", "line", "table", "csv", "json", "ndjson")
+
+
+def positive_int(text):
+    """Parse an argument that must be a whole number greater than 0"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"must be a whole number, not {text!r}") from None
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, not {value}")
+    return value
+
+
+def build_parser():
+    """Build the argument parser with a subcommand for each kind of request"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--api-key", default=os.environ.get("CLIMATE_API_KEY"),
+                        help="OpenWeather API key (default: $CLIMATE_API_KEY or settings)")
+    common.add_argument("--format", choices=FORMATS, default="line",
+                        help="output format (default: line)")
+    common.add_argument("--no-cache", action="store_true",
+                        help="always ask the API instead of using cached responses")
+    common.add_argument("--no-history", action="store_true",
+                        help="do not add fetched weather to the observation history")
+    common.add_argument("--profile", help="use a saved location profile")
+    common.add_argument("--offline", nargs="?", const=snapshot.SNAPSHOT_FILE, metavar="FILE",
+                        help="read weather from a snapshot made by export instead of "
+                             f"the API (default: {snapshot.SNAPSHOT_FILE})")
+    common.add_argument("--timings", nargs="?", const="-", metavar="FILE",
+                        help="time each stage and report it at exit, on stderr "
+                             "or as Prometheus metrics in FILE "
+                             f"(default: ${profiling.ENV_VAR})")
+
+    parser = argparse.ArgumentParser(
+        prog="cli-mate", description="A simple weather fetcher for the command line")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    weather = subparsers.add_parser("weather", parents=[common],
+                                    help="current weather for a zip code")
+    weather.add_argument("--zip", dest="zip_code", help="zip code (default: settings)")
+
+    forecast = subparsers.add_parser("forecast", parents=[common],
+                                     help="5 day, 3 hour forecast for a zip code")
+    forecast.add_argument("--zip", dest="zip_code", help="zip code (default: settings)")
+    forecast.add_argument("--date", type=date.fromisoformat,
+                          help="only show the forecast for this date (YYYY-MM-DD)")
+    forecast.add_argument("-n", "--count", type=positive_int,
+                          help="only ask for the next COUNT 3 hour slots "
+                               f"(at most {fetch.FORECAST_SLOTS})")
+
+    city = subparsers.add_parser("city", parents=[common],
+                                 help="current weather for a city")
+    city.add_argument("name", help="city name")
+    city.add_argument("--state", help="U.S. state code used to pick between cities")
+    city.add_argument("--country", help="country code used to pick between cities")
+
+    near = subparsers.add_parser("near", parents=[common],
+                                 help="current weather for the cities nearest to a point")
+    near.add_argument("lat", type=float, help="latitude")
+    near.add_argument("lon", type=float, help="longitude")
+    near.add_argument("-n", "--limit", type=positive_int, default=1,
+                      help="how many of the nearest cities to show (default: 1)")
+    near.add_argument("-r", "--radius", type=float,
+                      help="only show cities within this many km")
+
+    batch = subparsers.add_parser("batch", parents=[common],
+                                  help="current weather for many locations")
+    batch.add_argument("locations", nargs="*",
+                       help="zip codes, city names or city IDs (id:<number>)")
+    batch.add_argument("-f", "--file", help="read locations from a file, one per line")
+    batch.add_argument("-w", "--workers", type=positive_int, default=8)
+    batch.add_argument("--rpm", type=positive_int, default=60, help="maximum requests per minute")
+    batch.add_argument("--forecast", action="store_true",
+                       help="fetch forecasts and print a summary of each day")
+
+    follow = subparsers.add_parser("watch", parents=[common],
+                                   help="keep printing the weather of locations as it changes")
+    follow.add_argument("locations", nargs="*",
+                        help="zip codes, city names or city IDs (id:<number>)")
+    follow.add_argument("-f", "--file", help="read locations from a file, one per line")
+    follow.add_argument("--rpm", type=positive_int, default=60, help="maximum requests per minute")
+    follow.add_argument("--duration", type=float,
+                        help="stop after this many seconds (default: run until interrupted)")
+
+    past = subparsers.add_parser("history", parents=[common],
+                                 help="weather stored from earlier fetches")
+    past.add_argument("location", nargs="?",
+                      help="zip code, city name or city ID (id:<number>); "
+                           "omit to list the stored locations")
+    past.add_argument("--kind", choices=("current", "forecast"), default="current")
+    past.add_argument("--since", type=datetime.fromisoformat,
+                      help="only show weather from this time on (YYYY-MM-DD[THH:MM])")
+    past.add_argument("--until", type=datetime.fromisoformat,
+                      help="only show weather before this time")
+    past.add_argument("--rollup", choices=("hour", "day"),
+                      help="summarise each hour or day instead of listing every report")
+
+    index = subparsers.add_parser("build-index", parents=[common],
+                                  help="compile the city list into the city index")
+    index.add_argument("-w", "--workers", type=positive_int, default=os.cpu_count(),
+                       help="worker processes (default: one per core)")
+
+    export = subparsers.add_parser("export", parents=[common],
+                                   help="save the weather and forecast of locations, "
+                                        "with the city index, for offline use")
+    export.add_argument("locations", nargs="*",
+                        help="zip codes, city names or city IDs (id:<number>)")
+    export.add_argument("-f", "--file", help="read locations from a file, one per line")
+    export.add_argument("-o", "--output", default=snapshot.SNAPSHOT_FILE,
+                        help=f"snapshot file to write (default: {snapshot.SNAPSHOT_FILE})")
+    export.add_argument("-w", "--workers", type=positive_int, default=8)
+    export.add_argument("--rpm", type=positive_int, default=60, help="maximum requests per minute")
+
+    return parser
+
+
+def load_settings(args):
+    """Load settings without prompting and apply overrides from the arguments"""
+    settings = config.load_settings(interactive=False, profile=args.profile)
+    if args.api_key:
+        settings["API_KEY"] = args.api_key
+    if getattr(args, "zip_code", None):
+        settings["zip_code"] = args.zip_code
+    if args.no_cache:
+        settings["use_cache"] = False
+    if args.no_history:
+        settings["record_history"] = False
+    return settings
+
+
+def resolve_city(name, state=None, country=None):
+    """
+    Pick a city for name without prompting. The first exact match that fits
+    state and country is used, then the first city whose name starts with
+    name. Nothing else is guessed: if the city index has no such city, None
+    is returned and the name is left for OpenWeather to look up. Raises
+    LookupError if the index has cities by that name but none fit state and
+    country
+    """
+    def fits(city):
+        return ((not state or city.get("state") == state.upper())
+                and (not country or city["country"] == country.upper()))
+
+    exact = helpers.same_name_cities(name.title())
+    if exact is None:
+        return None
+    for city in exact:
+        if fits(city):
+            return city
+
+    folded = search.fold(name)
+    prefix = [city for city in helpers.search_cities(name) or []
+              if search.fold(city["name"]).startswith(folded)]
+    for city in prefix:
+        if fits(city):
+            return city
+
+    if (state or country) and (exact or prefix):
+        where = ", ".join(part.upper() for part in (state, country) if part)
+        raise LookupError(f"No city named {name} in {where}")
+    return None
+
+
+def write_records(out, records, fmt, name="", header=True, utc_offset=None):
+    """
+    Write weather records to out in the chosen format. Text formats show times
+    in the time zone utc_offset seconds from UTC, or each record's own
+    """
+    with profiling.stage("render"):
+        if fmt == "json":
+            json.dump([models.to_dict(record) for record in records], out, ensure_ascii=False)
+            out.write("\n")
+        elif fmt == "ndjson":
+            out.write("".join(f"{json.dumps(models.to_dict(record), ensure_ascii=False)}\n"
+                              for record in records))
+        else:
+            layout = "full" if fmt == "text" else fmt
+            render.get_renderer(layout).write(records, out, name, header, utc_offset)
+
+
+def write_summaries(out, summaries, fmt):
+    """Write daily forecast summaries to out in the chosen format"""
+    if fmt in ("json", "ndjson"):
+        for summary in summaries:
+            record = dict(models.to_dict(summary), date=summary.date.isoformat())
+            out.write(json.dumps(record, ensure_ascii=False))
+            out.write("\n")
+    else:
+        out.write("".join(
+            f"{summary.location.replace(' ', '_')} {summary.date} "
+            f"slots={summary.slots} min={summary.temp_min} max={summary.temp_max} "
+            f"mean={summary.temp_mean} humidity={summary.humidity_mean} "
+            f"wind_max={summary.wind_max} precip={summary.precipitation}\n"
+            for summary in summaries))
+
+
+def run_weather(args, settings, out):
+    record = fetch.request_weather(settings, fetch.zip_params(settings))
+    if record is None:
+        return 1
+    write_records(out, [record], args.format)
+    return 0
+
+
+def run_forecast(args, settings, out):
+    # The forecast never has more slots than this, so a larger count asks for
+    # all of them
+    count = args.count and min(args.count, fetch.FORECAST_SLOTS)
+    if args.date and not count:
+        # Nothing after the chosen date is shown, so there is no need to ask for
+        # it. The city's time zone is not known until the forecast arrives, so
+        # the date is allowed to end as late as it does anywhere
+        end = datetime.combine(args.date + timedelta(days=1), datetime.min.time(),
+                               timezone.utc)
+        count = fetch.slots_until(end.timestamp() + timezones.MAX_UTC_OFFSET)
+    forecast = fetch.request_forecast(settings, fetch.zip_params(settings), count)
+    if forecast is None:
+        return 1
+    city, weather_data_list = forecast
+    if args.date:
+        weather_data_list = helpers.filter_by_date(weather_data_list, args.date,
+                                                   utc_offset=city.timezone)
+    write_records(out, weather_data_list, args.format, city.name,
+                  utc_offset=city.timezone)
+    return 0
+
+
+def run_city(args, settings, out):
+    try:
+        city_choice_dict = resolve_city(args.name, args.state, args.country)
+    except LookupError as e:
+        print(e)
+        return 1
+    if city_choice_dict:
+        params = fetch.city_params(city_choice_dict["name"], city_choice_dict)
+    else:
+        # Not in the city index, so OpenWeather is asked for the name as given
+        params = {"q": ",".join(part for part in (args.name, args.state, args.country) if part)}
+    record = fetch.request_weather(settings, params)
+    if record is None:
+        return 1
+    write_records(out, [record], args.format)
+    return 0
+
+
+def run_near(args, settings, out):
+    nearby = helpers.nearby_cities(args.lat, args.lon, args.limit, args.radius)
+    if nearby is None:
+        return 1
+    if not nearby:
+        if args.radius is None:
+            print("No cities with coordinates were found in the city list")
+        else:
+            print(f"No cities within {args.radius}km of {args.lat}, {args.lon}")
+        return 1
+
+    # The nearby cities are all asked for by ID, so they share group requests
+    city_ids = [city["id"] for _, city in nearby]
+    results = fetch.request_group(settings, city_ids)
+    records = [results[city_id] for city_id in city_ids if city_id in results]
+    write_records(out, records, args.format)
+    return 0 if len(records) == len(city_ids) else 1
+
+
+def run_batch(args, settings, out):
+    import batch
+
+    locations = list(args.locations)
+    if args.file:
+        locations += batch.read_locations(args.file)
+
+    # A single JSON document can only be written once every result is in, so
+    # batches stream one JSON object per line instead
+    fmt = "ndjson" if args.format == "json" else args.format
+    endpoint = "forecast" if args.forecast else "weather"
+    store = forecast_store.ForecastStore()
+    status = 0
+    header = True
+    for location, data in batch.run_batch(settings, locations, args.workers,
+                                          args.rpm, endpoint):
+        if data is None:
+            print(f"No weather data for {location}", file=sys.stderr)
+            status = 1
+            continue
+        if args.forecast:
+            # Forecasts from every location share one column store, and each
+            # location is summarised from its own rows as soon as it arrives
+            city, slots = data
+            rows = store.add(location, slots, city.timezone)
+            write_summaries(out, store.daily_summaries(rows), fmt)
+        else:
+            write_records(out, [data], fmt, header=header)
+            header = False
+        out.flush()
+    return status
+
+
+def run_watch(args, settings, out):
+    import batch
+    import watch
+
+    locations = list(args.locations)
+    if args.file:
+        locations += batch.read_locations(args.file)
+    if not locations:
+        print("No locations to watch", file=sys.stderr)
+        return 1
+
+    fmt = "ndjson" if args.format == "json" else args.format
+    header = [True]
+
+    def emit(location, record):
+        write_records(out, [record], fmt, location, header[0])
+        header[0] = False
+        out.flush()
+
+    # The settings file is checked again before every poll, so a new API key
+    # or zip code is picked up without restarting the watch
+    watch.run(lambda: load_settings(args), locations, emit, args.duration, args.rpm)
+    return 0
+
+
+def run_history(args, settings, out):
+    import batch
+    import history
+
+    store = history.get_history()
+    if not args.location:
+        out.write("".join(f"{location} {kind} count={count} "
+                          f"from={datetime.fromtimestamp(first).isoformat()} "
+                          f"to={datetime.fromtimestamp(last).isoformat()}\n"
+                          for location, kind, count, first, last in store.locations()))
+        return 0
+
+    location = history.location_key(batch.parse_location(args.location))
+    start = int(args.since.timestamp()) if args.since else None
+    end = int(args.until.timestamp()) if args.until else None
+
+    if args.rollup:
+        for rollup in store.rollup(location, args.rollup, start, end, args.kind):
+            if args.format in ("json", "ndjson"):
+                out.write(json.dumps(models.to_dict(rollup)) + "\n")
+            else:
+                out.write(f"{args.location.replace(' ', '_')} "
+                          f"{datetime.fromtimestamp(rollup.start).isoformat()} "
+                          f"count={rollup.count} min={rollup.temp_min} "
+                          f"max={rollup.temp_max} mean={rollup.temp_mean} "
+                          f"humidity={rollup.humidity_mean} wind_max={rollup.wind_max} "
+                          f"precip={rollup.precipitation}\n")
+        return 0
+
+    # Write the records in chunks so a long history is never held in memory
+    fmt = "ndjson" if args.format == "json" else args.format
+    header = True
+    chunk = []
+    for record in store.query(location, start, end, args.kind):
+        chunk.append(record)
+        if len(chunk) == 500:
+            write_records(out, chunk, fmt, args.location, header)
+            header = False
+            chunk = []
+    if chunk:
+        write_records(out, chunk, fmt, args.location, header)
+    return 0
+
+
+def run_export(args, settings, out):
+    import batch
+    import city_index
+
+    locations = list(args.locations)
+    if args.file:
+        locations += batch.read_locations(args.file)
+    if not locations:
+        print("No locations to export", file=sys.stderr)
+        return 1
+
+    status = 0
+    with snapshot.SnapshotWriter(args.output) as writer:
+        for endpoint in ("weather", "forecast"):
+            for location, data in batch.run_batch(settings, locations, args.workers,
+                                                  args.rpm, endpoint):
+                params = batch.parse_location(location)
+                if data is None:
+                    print(f"No {endpoint} data for {location}", file=sys.stderr)
+                    status = 1
+                elif endpoint == "forecast":
+                    writer.add_forecast(params, *data)
+                else:
+                    writer.add_weather(params, data)
+        try:
+            writer.add_city_index(city_index.serialize_index(helpers.CITY_FILE))
+        except FileNotFoundError:
+            print(f"File Not Found: {helpers.CITY_FILE} is needed to look cities up "
+                  "offline. The snapshot has no city index.")
+    print(f"Saved {writer.count} responses for {len(locations)} locations to {args.output}")
+    return status
+
+
+def run_build_index(args, settings, out):
+    import city_index
+
+    if not os.path.exists(helpers.CITY_FILE):
+        print(f"File Not Found: {helpers.CITY_FILE} is needed to build the city index.")
+        return 1
+
+    start = time.perf_counter()
+    count = city_index.build_index_parallel(helpers.CITY_FILE, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(helpers.CITY_FILE)
+    out.write(f"{city_index.INDEX_FILE} cities={count} workers={args.workers} "
+              f"seconds={elapsed:.2f} cities_per_second={count / elapsed:.0f} "
+              f"mib_per_second={size / elapsed / 2 ** 20:.1f}\n")
+    return 0
+
+
+COMMANDS = {
+    "weather": run_weather,
+    "forecast": run_forecast,
+    "city": run_city,
+    "near": run_near,
+    "batch": run_batch,
+    "watch": run_watch,
+    "history": run_history,
+    "build-index": run_build_index,
+    "export": run_export,
+}
+
+
+def main(argv=None):
+    """
+    Run one command and return the exit status. Nothing is ever read from the
+    terminal, and messages meant for people go to stderr so stdout only holds
+    the requested output
+    """
+    args = build_parser().parse_args(argv)
+    if args.timings:
+        profiling.enable(args.timings)
+    else:
+        profiling.enable_from_env()
+
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            with profiling.stage("settings"):
+                settings = load_settings(args)
+        except KeyError:
+            print(f"Unknown profile: {args.profile}")
+            return 2
+        if args.offline:
+            try:
+                snapshot.use_snapshot(args.offline)
+            except (OSError, ValueError) as e:
+                print(f"Unable to read the snapshot {args.offline}: {e}")
+                return 2
+        return COMMANDS[args.command](args, settings, out)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import profiling
+
+# A shared HTTP client for the OpenWeather API
+
+BASE_URL = "https://api.openweathermap.org/data/2.5"
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+POOL_SIZE = 10
+
+# Responses with these status codes are worth asking for again
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+LATENCY_HISTORY = 1000
+
+
+class RequestFailed(Exception):
+    """Raised when a request could not be completed, even after retrying"""
+
+
+def retry_after(value, now=None):
+    """
+    Return the number of seconds to wait given by a Retry-After header, which
+    is either a number of seconds or an HTTP date. Return None if the value
+    can not be understood
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, when.timestamp() - now)
+
+
+class WeatherClient:
+    """
+    Send requests to the API over one pooled, keep-alive session. Requests
+    time out instead of hanging, and failures that are likely temporary are
+    retried with exponential backoff and jitter. The latency of every
+    request is recorded. If limiter is set, each attempt waits for it first
+    """
+
+    def __init__(self, base_url=BASE_URL, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 pool_size=POOL_SIZE, sleep=time.sleep):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.sleep = sleep
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+        self.limiter = None
+        self._session = None
+
+    @property
+    def session(self):
+        """The requests session, created the first time it is needed"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                  pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def backoff(self, attempt, response=None):
+        """Return how long to wait before retrying after a failed attempt"""
+        if response is not None and response.status_code == 429:
+            delay = retry_after(response.headers.get("Retry-After"))
+            if delay is not None:
+                return min(delay, self.backoff_max)
+
+        # Full jitter: anywhere between no wait and the exponential ceiling
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def get(self, endpoint, params=None, headers=None, stream=False):
+        """
+        Send a GET request for an endpoint and return the response. The last
+        response is returned if every retry still failed with a retryable
+        status. Raises RequestFailed if no response could be received. With
+        stream, the body is left unread for the caller to iterate over
+        """
+        import requests
+
+        url = f"{self.base_url}/{endpoint}"
+        for attempt in range(self.max_retries + 1):
+            if self.limiter is not None:
+                self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                with profiling.stage("network"):
+                    response = self.session.get(url, params=params, headers=headers,
+                                                timeout=self.timeout, stream=stream)
+            except requests.RequestException as e:
+                self.latencies.append((endpoint, None, time.perf_counter() - start))
+                if attempt == self.max_retries:
+                    raise RequestFailed(str(e)) from e
+                self.sleep(self.backoff(attempt))
+                continue
+
+            self.latencies.append((endpoint, response.status_code,
+                                   time.perf_counter() - start))
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            response.close()
+            self.sleep(self.backoff(attempt, response))
+
+    def latency_summary(self):
+        """Return the count, mean and maximum latency of recorded requests"""
+        times = [seconds for _, _, seconds in self.latencies]
+        if not times:
+            return {"count": 0, "mean": 0.0, "max": 0.0}
+        return {"count": len(times), "mean": sum(times) / len(times), "max": max(times)}
+
+    def close(self):
+        """Close the pooled connections"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+_client = None
+
+
+def get_client(settings=None):
+    """
+    Return the client shared by every fetch function, creating it on first use.
+    Timeouts and the base address can be overridden in settings
+    """
+    global _client
+    if _client is None:
+        settings = settings or {}
+        _client = WeatherClient(
+            base_url=settings.get("base_url", BASE_URL),
+            connect_timeout=settings.get("connect_timeout", CONNECT_TIMEOUT),
+            read_timeout=settings.get("read_timeout", READ_TIMEOUT),
+            max_retries=settings.get("max_retries", MAX_RETRIES))
+    return _client
+
+
+def close_client():
+    """
+    Close the shared client and forget it, so the next call to get_client
+    builds a new one from the settings it is given
+    """
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -1,24 +1,51 @@
+import copy
 import json
+import os
+import cache
+import client
 
 # Functions related to user settings
 
 FILENAME = 'settings.json'
 
+# Settings that belong to a location profile rather than to every location
+PROFILE_KEYS = ("zip_code",)
+
+# The settings last read from or written to the file, with the modification
+# time and size of the file at that point
+_loaded = None
+
 def set_settings(settings):
     """Display menu options for settings. Take user input for settings and save"""
 
     while True:
         print("\nSettings")                                                                 
-        print("""
+        print(f"""
     (1) Enter an API key
     (2) Enter your zip code
-    (3) Exit\n""")        
+    (3) Turn the weather cache {'off' if settings.get("use_cache", True) else 'on'}
+    (4) Clear the weather cache
+    (5) Switch location profile{f' (now {settings["profile"]})' if settings.get("profile") else ''}
+    (6) Exit\n""")        
         choice = input("What would you like to do? ").strip()                           
         if choice == '1':                                                       
             settings["API_KEY"] = input("Enter your API key: ").strip()                
         elif choice == '2':                                                     
             settings["zip_code"] = input("Enter your zip code: ").strip()               
+            if settings.get("profile"):
+                settings["profiles"][settings["profile"]]["zip_code"] = settings["zip_code"]
         elif choice == '3':
+            settings["use_cache"] = not settings.get("use_cache", True)
+        elif choice == '4':
+            cache.clear()
+            print("Weather cache cleared")
+        elif choice == '5':
+            names = ", ".join(settings.get("profiles", {})) or "none yet"
+            print(f"Profiles: {names}")
+            name = input("Enter a profile name (a new name saves the current location): ").strip()
+            if name:
+                use_profile(settings, name)
+        elif choice == '6':
             save_settings(settings)                                             
             break                                                               
         else:                                                                   
@@ -27,28 +54,108 @@ def set_settings(settings):
     return settings
 
 
+def use_profile(settings, name):
+    """
+    Make a named location profile the active one. A profile that does not
+    exist yet is created from the current location
+    """
+    profiles = settings.setdefault("profiles", {})
+    if name in profiles:
+        settings.update(profiles[name])
+    else:
+        profiles[name] = {key: settings.get(key, "") for key in PROFILE_KEYS}
+    settings["profile"] = name
+
+
+def _file_state():
+    """Return the modification time and size of the settings file, or None"""
+    try:
+        stat = os.stat(FILENAME)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def settings_changed(old, new):
+    """
+    Drop whatever depended on the old location or API key. Cached responses
+    for the old zip code are discarded, and the pooled client is closed so
+    the next request starts afresh
+    """
+    if old.get("zip_code") and old.get("zip_code") != new.get("zip_code"):
+        import fetch
+
+        params = fetch.request_params(old, fetch.zip_params(old))
+        for endpoint in ("weather", "forecast"):
+            cache.get_cache().discard(cache.make_key(endpoint, params))
+    if old.get("API_KEY") != new.get("API_KEY"):
+        client.close_client()
+
+
+def read_settings():
+    """
+    Return the settings stored in the file. The file is only read again when
+    its modification time or size has changed since it was last read, and
+    each caller gets its own copy. Raises FileNotFoundError if it is missing
+    """
+    global _loaded
+    state = _file_state()
+    if state is None:
+        raise FileNotFoundError(FILENAME)
+    if _loaded is None or _loaded[0] != state:
+        with open(FILENAME, 'r', encoding="utf-8") as f:
+            settings = json.load(f)
+        if _loaded is not None:
+            settings_changed(_loaded[1], settings)
+        _loaded = (state, settings)
+    return copy.deepcopy(_loaded[1])
+
+
 def save_settings(settings):
-    """Save user settings to a text file in json format"""
- 
+    """
+    Save user settings to a text file in json format. The settings are written
+    to a temporary file that then replaces the old one, so a crash part way
+    through never leaves a truncated file behind
+    """
+    global _loaded
+    tmp_file = f"{FILENAME}.{os.getpid()}.tmp"
     try:                                                                        
-        with open(FILENAME, 'w', encoding="utf-8") as f:                                          
+        with open(tmp_file, 'w', encoding="utf-8") as f:                                          
             json.dump(settings, f, ensure_ascii=False)                                              
-    except FileNotFoundError:                                                   
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, FILENAME)
+    except OSError:                                                   
         print("There is an issue with the file")                                
     else:                                                                       
+        if _loaded is not None:
+            settings_changed(_loaded[1], settings)
+        _loaded = (_file_state(), copy.deepcopy(settings))
         print("File saved")
 
 
-def load_settings():
-    """Load user settings from text file and store them in a dictionary"""
+def load_settings(interactive=True, profile=None):
+    """
+    Load user settings from text file and store them in a dictionary. If the
+    file is missing and interactive is False, return empty settings instead of
+    prompting for them. If profile is given, that location profile is used in
+    place of the one saved as active. Raises KeyError for an unknown profile
+    """
     
     try:                                                                        
-        with open(FILENAME, 'r', encoding="utf-8") as f:                                          
-            settings = json.load(f)                                             
+        settings = read_settings()
     except FileNotFoundError:                      
-        print("It seems that setting have not been entered. Please enter them now.")
         default_settings = {"API_KEY": "", "zip_code": ""}                      
-        settings = set_settings(default_settings)
-        save_settings(settings)
+        if not interactive:
+            settings = default_settings
+        else:
+            print("It seems that setting have not been entered. Please enter them now.")
+            settings = set_settings(default_settings)
+            save_settings(settings)
+
+    if profile:
+        if profile not in settings.get("profiles", {}):
+            raise KeyError(profile)
+        use_profile(settings, profile)
                                                  
     return settings
@@ -1,66 +1,370 @@
-import requests
+import math
+import threading
+import time
+from collections import OrderedDict
+
 import ui_helpers
 import helpers
+import cache
+import client
+import history
+import models
+import profiling
+import snapshot
 
 # Functions related to the OpenWeather API
 
-def fetch_weather(settings):
-    """Fetch current weather from OpenWeatherMap based on zip code"""                                                                     
-    weather_address = f"https://api.openweathermap.org/data/2.5/weather?zip={settings["zip_code"]},us&appid={settings["API_KEY"]}&units=imperial"
+# The most city IDs OpenWeather accepts in one request to the group endpoint
+GROUP_SIZE = 20
+
+# How many bytes of a streamed response to read at a time
+CHUNK_SIZE = 8 * 1024
+
+# The forecast is given in 40 slots of 3 hours
+FORECAST_SLOTS = 40
+SLOT_SECONDS = 3 * 60 * 60
+
+# How long a cached forecast is kept after it stops being fresh, so it can be
+# checked against the server instead of downloaded again
+FORECAST_KEEP = 5 * 24 * 60 * 60
+
+# Forecasts parsed in this process, most recently used last
+PARSED_FORECASTS = 32
+_parsed_forecasts = OrderedDict()
+_parsed_lock = threading.Lock()
+
+
+def request_params(settings, params):
+    """Add the API key and units every request needs to its query parameters"""
+    return dict(params, appid=settings["API_KEY"], units="imperial")
+
+
+def request_json(settings, endpoint, params):
+    """
+    Request data from an OpenWeather endpoint. params must already hold the
+    API key. Fresh responses are served from the cache unless the user has
+    turned it off in settings. Return the decoded response and whether it
+    was fetched from the API rather than the cache, or (None, False) if the
+    response was not good
+    """
+    use_cache = settings.get("use_cache", True)
+
+    key = cache.make_key(endpoint, params)
+    if use_cache:
+        data = cache.get_cache().get(key)
+        if data is not None:
+            return data, False
 
     # Fetch the data from OpenWeather and verify that the response was good.
-    r = requests.get(weather_address) 
+    try:
+        r = client.get_client(settings).get(endpoint, params)
+    except client.RequestFailed as e:
+        print(f"""
+        ERROR: Unable to reach OpenWeather ({e}). Please check your internet
+        connection and try again.
+        """)
+        return None, False
     verified = helpers.verify_response(r.status_code)
-    if verified:                         
-        weather_dict = r.json()
-        weather_data_list = [weather_dict]
-        ui_helpers.print_weather(weather_data_list)
+    if not verified:
+        return None, False
 
+    with profiling.stage("decode"):
+        data = r.json()
+    if use_cache:
+        cache.get_cache().put(key, data, cache.ttl_for(endpoint, data))
+    return data, True
 
-def fetch_forecast(settings):
-    """Fetch 5 day, 3 hour forecast from OpeWeatherMap based on zip code"""
 
-    forecast_address = f"https://api.openweathermap.org/data/2.5/forecast?zip={settings["zip_code"]},us&appid={settings["API_KEY"]}&units=imperial"
+def record_history(settings, params, kind, records):
+    """
+    Add records fetched from the API to the observation history, unless that
+    is turned off. kind is 'current' or 'forecast'
+    """
+    if settings.get("record_history", True):
+        history.get_history().append(history.location_key(params), kind, records)
 
-    # Fetch the data from OpenWeather and verify that the response is good
-    r = requests.get(forecast_address)
-    verified = helpers.verify_response(r.status_code)
 
-    if verified:
-        forecast_dict = r.json()
-        weather_data_list = forecast_dict['list']
-        name = forecast_dict['city']['name']
+def request_weather(settings, params):
+    """
+    Request the current weather for a location and return it parsed into an
+    Observation, or None if the response was not good. The response is parsed
+    once, and an observation fetched from the API is added to the history.
+    When offline, the observation is read from the snapshot instead
+    """
+    params = request_params(settings, params)
+    if snapshot.current() is not None:
+        return offline_response("weather", params)
+
+    data, fetched = request_json(settings, "weather", params)
+    if data is None:
+        return None
+    record = models.parse_observation(data)
+    if fetched:
+        record_history(settings, params, "current", [record])
+    return record
+
+
+def offline_response(endpoint, params):
+    """
+    Look a request up in the snapshot being read offline. Return the saved
+    observation or forecast, or None after telling the user if the location
+    was not saved
+    """
+    saved = snapshot.current()
+    data = saved.forecast(params) if endpoint == "forecast" else saved.weather(params)
+    if data is None:
+        print(f"""
+        ERROR: {history.location_key(params)} is not in the snapshot
+        {saved.filename}. Export a snapshot with this location to get its
+        weather offline.
+        """)
+    return data
+
+
+def _remember_forecast(key, text, city, slots):
+    """Keep a parsed forecast for reuse while its text stays the same"""
+    with _parsed_lock:
+        _parsed_forecasts[key] = (text, city, slots)
+        _parsed_forecasts.move_to_end(key)
+        while len(_parsed_forecasts) > PARSED_FORECASTS:
+            _parsed_forecasts.popitem(last=False)
+
+
+def _parsed_forecast(key, entry):
+    """
+    Return the city and slots of a cached forecast entry. A forecast already
+    parsed in this process is reused as it is, so one that is still fresh, or
+    that the server confirms has not changed, is not decoded again
+    """
+    with _parsed_lock:
+        parsed = _parsed_forecasts.get(key)
+    if parsed is None or parsed[0] != entry["text"]:
+        with profiling.stage("decode"):
+            city, slots = models.parse_forecast_stream([entry["text"]])
+        parsed = (entry["text"], city, slots)
+    _remember_forecast(key, *parsed)
+    _, city, slots = parsed
+    # Callers narrow the list of slots in place, so each gets its own list
+    return city, list(slots)
+
+
+def request_forecast(settings, params, count=None):
+    """
+    Request a forecast and return its city and slots, or None if the response
+    was not good. count limits the forecast to the next count 3 hour slots.
+    The response body is parsed as it arrives, one slot at a time, instead of
+    being decoded into one large dictionary first.
+
+    The raw text is cached along with the ETag and Last-Modified time the
+    server sent. Once it is no longer fresh it is kept for a while longer, and
+    the next request asks the server whether it has changed. If not, the
+    server answers 304 with no body and the cached forecast is used again
+    """
+    params = request_params(settings, params)
+    if count:
+        params["cnt"] = count
+    if snapshot.current() is not None:
+        return offline_response("forecast", params)
+    use_cache = settings.get("use_cache", True)
+
+    key = cache.make_key("forecast", params)
+    entry = cache.get_cache().get(key) if use_cache else None
+    if not (isinstance(entry, dict) and "text" in entry):
+        entry = None
+    if entry and time.time() - entry["fetched"] < cache.ttl_for("forecast"):
+        return _parsed_forecast(key, entry)
+
+    headers = {"Accept-Encoding": "gzip"}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        r = client.get_client(settings).get("forecast", params, headers, stream=True)
+    except client.RequestFailed as e:
+        print(f"""
+        ERROR: Unable to reach OpenWeather ({e}). Please check your internet
+        connection and try again.
+        """)
+        return None
+    with r:
+        if r.status_code == 304 and entry:
+            profiling.count("status", 304)
+            entry = dict(entry, fetched=time.time(),
+                         etag=r.headers.get("ETag", entry.get("etag")),
+                         last_modified=r.headers.get("Last-Modified", entry.get("last_modified")))
+            cache.get_cache().put(key, entry, FORECAST_KEEP)
+            return _parsed_forecast(key, entry)
+
+        verified = helpers.verify_response(r.status_code)
+        if not verified:
+            return None
+
+        chunks = []
+
+        def read():
+            for chunk in r.iter_content(CHUNK_SIZE):
+                if use_cache:
+                    chunks.append(chunk)
+                yield chunk
+        with profiling.stage("decode"):
+            city, slots = models.parse_forecast_stream(read())
+
+    if use_cache:
+        entry = {"fetched": time.time(), "etag": r.headers.get("ETag"),
+                 "last_modified": r.headers.get("Last-Modified"),
+                 "text": b"".join(chunks).decode("utf-8")}
+        cache.get_cache().put(key, entry, FORECAST_KEEP)
+        _remember_forecast(key, entry["text"], city, slots)
+        slots = list(slots)
+    record_history(settings, params, "forecast", slots)
+    return city, slots
+
+
+def slots_until(end, now=None):
+    """Return how many 3 hour forecast slots are needed to reach the unix time end"""
+    now = time.time() if now is None else now
+    return max(1, min(FORECAST_SLOTS, math.ceil((end - now) / SLOT_SECONDS)))
+
+
+def request_group(settings, city_ids):
+    """
+    Fetch the current weather for many city IDs, packing up to GROUP_SIZE of
+    them into each request. IDs with a fresh cached report are not requested.
+    Return a dictionary of the Observations that were found, keyed by city ID
+    """
+    city_ids = list(dict.fromkeys(int(city_id) for city_id in city_ids))
+    saved = snapshot.current()
+    if saved is not None:
+        found = {city_id: saved.weather({"id": city_id}) for city_id in city_ids}
+        return {city_id: record for city_id, record in found.items() if record is not None}
+
+    use_cache = settings.get("use_cache", True)
+    results = {}
+    pending = []
+    for city_id in city_ids:
+        key = cache.make_key("weather", request_params(settings, {"id": city_id}))
+        data = cache.get_cache().get(key) if use_cache else None
+        if data is None:
+            pending.append(city_id)
+        else:
+            results[city_id] = models.parse_observation(data)
+
+    # The group response itself is not cached. Each report in it is cached
+    # under its own ID below, with the TTL of a single report
+    group_settings = dict(settings, use_cache=False)
+    for i in range(0, len(pending), GROUP_SIZE):
+        chunk = pending[i:i + GROUP_SIZE]
+        params = request_params(settings, {"id": ",".join(map(str, chunk))})
+        group, _ = request_json(group_settings, "group", params)
+        if not group:
+            continue
+        for data in group.get("list", []):
+            record = results[data["id"]] = models.parse_observation(data)
+            # Cache each report on its own, so a later lookup of one city by ID
+            # is served without asking for the whole group again
+            if use_cache:
+                key = cache.make_key("weather", request_params(settings, {"id": data["id"]}))
+                cache.get_cache().put(key, data, cache.ttl_for("weather", data))
+            record_history(settings, {"id": data["id"]}, "current", [record])
+    return results
+
+
+def zip_params(settings):
+    """Return the query parameters for a request by the zip code in settings"""
+    return {"zip": f"{settings['zip_code']},us"}
+
+
+def fetch_weather(settings):
+    """Fetch current weather from OpenWeatherMap based on zip code"""
+    record = request_weather(settings, zip_params(settings))
+    if record:
+        ui_helpers.print_weather([record])
+
+
+def fetch_forecast(settings):
+    """Fetch 5 day, 3 hour forecast from OpeWeatherMap based on zip code"""
+    forecast = request_forecast(settings, zip_params(settings))
+
+    if forecast:
+        city, weather_data_list = forecast
+        name = city.name
         prompt = "\nDo you want to select a particular date?"
         prompt += "\nEnter 'y' for yes, anything else to print all forecast data: "
-        helpers.refine_date(weather_data_list, prompt)
-        ui_helpers.print_weather(weather_data_list, name)
+        helpers.refine_date(weather_data_list, prompt, utc_offset=city.timezone)
+        ui_helpers.print_weather(weather_data_list, name, city.timezone)
 
 
-def weather_by_city(settings):
-    """Attempt to get the weather of a particular city entered by the user"""
-    city = input("\nEnter city name: ").strip().title()
-    
-    # Make a list of possible cities that the user could be requesting
-    city_list = helpers.same_name_cities(city)
-    
-    # If the list of possible cites is larger than one prompt the user to pick pne
-    city_choice_dict = None
-    if len(city_list) > 1:
-        city_choice_dict = helpers.verify_city_choice(city_list)
+def city_params(city, city_choice_dict=None):
+    """
+    Return the query parameters for a request for a city. A city from the city
+    index is asked for by its ID, or its coordinates if it has no ID, so
+    OpenWeather does not have to look the name up again and possibly pick a
+    different city. The name is only sent when there is nothing better
+    """
+    if city_choice_dict:
+        if city_choice_dict.get("id") is not None:
+            return {"id": city_choice_dict["id"]}
+        coord = city_choice_dict.get("coord") or {}
+        if coord.get("lat") is not None and coord.get("lon") is not None:
+            return {"lat": coord["lat"], "lon": coord["lon"]}
 
-    # Build the address for the request based on the chosen city
-    city_address = f"https://api.openweathermap.org/data/2.5/weather?q={city}"
+    query = city
     if city_choice_dict:
         if city_choice_dict.get("state"):
-            city_address += f",{city_choice_dict["state"]}"
-        city_address += f",{city_choice_dict["country"]}"
-    city_address += f"&appid={settings["API_KEY"]}&units=imperial"
-    
-    # Fetch the data from OpenWeather and verify the response was good
-    r = requests.get(city_address)
-    verified = helpers.verify_response(r.status_code)
+            query += f",{city_choice_dict['state']}"
+        query += f",{city_choice_dict['country']}"
+    return {"q": query}
+
+
+def weather_near(settings, lat, lon):
+    """
+    Fetch the weather of the city nearest to a latitude and longitude. If the
+    city list is missing, OpenWeather is asked for the coordinates directly
+    """
+    nearby = helpers.nearby_cities(lat, lon)
+    if nearby:
+        params = city_params(nearby[0][1]["name"], nearby[0][1])
+    else:
+        params = {"lat": lat, "lon": lon}
+
+    record = request_weather(settings, params)
+    if record:
+        ui_helpers.print_weather([record])
+
+
+def weather_by_city(settings):
+    """
+    Attempt to get the weather of a particular city entered by the user. A
+    latitude and longitude can be entered instead, to get the weather of the
+    nearest city
+    """
+    city = input("\nEnter city name, or latitude and longitude: ").strip()
+    coordinates = helpers.parse_coordinates(city)
+    if coordinates:
+        weather_near(settings, *coordinates)
+        return
+    city = city.title()
+
+    # Make a list of possible cities that the user could be requesting. If
+    # there is no exact match, fall back to a ranked list of similar names
+    city_list = helpers.same_name_cities(city)
+    exact = True
+    if city_list == []:
+        city_list = helpers.search_cities(city)
+        exact = False
+
+    # If the list of possible cites is larger than one, or it only holds
+    # suggestions, prompt the user to pick one
+    city_choice_dict = None
+    if city_list and (len(city_list) > 1 or not exact):
+        city_choice_dict = helpers.verify_city_choice(city_list, exact)
+        city = city_choice_dict["name"]
+    elif city_list:
+        city_choice_dict = city_list[0]
 
-    if verified:
-        city_dict = r.json()
-        weather_data_list = [city_dict]
-        ui_helpers.print_weather(weather_data_list) 
+    # Fetch the data for the chosen city
+    record = request_weather(settings, city_params(city, city_choice_dict))
+    if record:
+        ui_helpers.print_weather([record])
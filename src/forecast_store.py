@@ -0,0 +1,151 @@
+import time
+from array import array
+from dataclasses import dataclass
+from datetime import date
+
+# Column oriented storage for forecast slots from one or many locations
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# date.fromordinal(EPOCH_ORDINAL + day number) is the date of a day number
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def local_offset(dt):
+    """Return the machine's offset from UTC, in seconds, at the unix time dt"""
+    return time.localtime(dt).tm_gmtoff
+
+
+@dataclass(slots=True)
+class DailySummary:
+    """Aggregated forecast values for one location on one day"""
+    location: str
+    date: date
+    slots: int
+    temp_min: float
+    temp_max: float
+    temp_mean: float
+    humidity_mean: float
+    wind_max: float
+    precipitation: float
+
+
+class ForecastStore:
+    """
+    Forecast slots held as parallel arrays, one per field, instead of one
+    object per slot. Every row also records which location it belongs to and
+    the local day it falls on, computed once when the row is added, so day
+    bucketing, summaries and time windows are single passes over flat arrays
+    """
+
+    def __init__(self):
+        self.locations = []
+        self.location_rows = array('I')
+        self.dt = array('q')
+        self.day = array('l')
+        self.temp = array('d')
+        self.humidity = array('d')
+        self.wind = array('d')
+        self.precipitation = array('d')
+
+    def __len__(self):
+        return len(self.dt)
+
+    def add(self, location, slots, utc_offset=None):
+        """
+        Append forecast slots for a location and return the range of rows
+        they were stored in. Days are counted in the time zone utc_offset
+        seconds from UTC, which defaults to the machine's at the first slot
+        """
+        start = len(self.dt)
+        if not slots:
+            return range(start, start)
+        if utc_offset is None:
+            utc_offset = local_offset(slots[0].dt)
+
+        location_id = len(self.locations)
+        self.locations.append(location)
+
+        count = len(slots)
+        self.location_rows.extend([location_id] * count)
+        self.dt.extend([slot.dt for slot in slots])
+        self.day.extend([(slot.dt + utc_offset) // SECONDS_PER_DAY for slot in slots])
+        self.temp.extend([slot.temp for slot in slots])
+        self.humidity.extend([slot.humidity for slot in slots])
+        self.wind.extend([slot.wind_speed for slot in slots])
+        self.precipitation.extend([(slot.rain or 0.0) + (slot.snow or 0.0) for slot in slots])
+        return range(start, start + count)
+
+    @classmethod
+    def from_slots(cls, slots, location="", utc_offset=None):
+        """Build a store holding the slots of a single location"""
+        store = cls()
+        store.add(location, slots, utc_offset)
+        return store
+
+    def dates(self, rows=None):
+        """Return the distinct local dates of the rows, in order"""
+        rows = range(len(self.dt)) if rows is None else rows
+        days = self.day[rows.start:rows.stop]
+        return [date.fromordinal(EPOCH_ORDINAL + day) for day in sorted(set(days))]
+
+    def day_rows(self, selected, rows=None):
+        """Return the indexes of the rows whose local date is selected"""
+        rows = range(len(self.dt)) if rows is None else rows
+        target = selected.toordinal() - EPOCH_ORDINAL
+        day = self.day
+        return [i for i in rows if day[i] == target]
+
+    def window_rows(self, start, end, rows=None):
+        """Return the indexes of the rows with start <= dt < end"""
+        rows = range(len(self.dt)) if rows is None else rows
+        dt = self.dt
+        return [i for i in rows if start <= dt[i] < end]
+
+    def daily_summaries(self, rows=None):
+        """
+        Summarise a range of rows per location and local day in one pass.
+        Rows are stored grouped by location and in time order, so each summary
+        is finished as soon as the location or day changes
+        """
+        rows = range(len(self.dt)) if rows is None else rows
+        window = slice(rows.start, rows.stop)
+        summaries = []
+        current = None
+
+        columns = zip(self.location_rows[window], self.day[window],
+                      self.temp[window], self.humidity[window],
+                      self.wind[window], self.precipitation[window])
+        for location_id, day, temp, humidity, wind, precipitation in columns:
+            key = (location_id, day)
+            if key != current:
+                if current is not None:
+                    summaries.append(self._summary(current, count, t_min, t_max,
+                                                   t_sum, h_sum, w_max, p_sum))
+                current = key
+                count = 0
+                t_min = t_max = temp
+                t_sum = h_sum = w_max = p_sum = 0.0
+
+            count += 1
+            if temp < t_min:
+                t_min = temp
+            elif temp > t_max:
+                t_max = temp
+            t_sum += temp
+            h_sum += humidity
+            if wind > w_max:
+                w_max = wind
+            p_sum += precipitation
+
+        if current is not None:
+            summaries.append(self._summary(current, count, t_min, t_max,
+                                           t_sum, h_sum, w_max, p_sum))
+        return summaries
+
+    def _summary(self, key, count, t_min, t_max, t_sum, h_sum, w_max, p_sum):
+        location_id, day = key
+        return DailySummary(self.locations[location_id],
+                            date.fromordinal(EPOCH_ORDINAL + day), count,
+                            t_min, t_max, round(t_sum / count, 1),
+                            round(h_sum / count, 1), w_max, round(p_sum, 2))
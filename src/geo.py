@@ -0,0 +1,162 @@
+import heapq
+import math
+from array import array
+
+# A spatial index over the city list for nearest city and radius queries
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Ranges of the tree with this many points or fewer are scanned directly
+LEAF_SIZE = 8
+
+# How many points of a range are looked at to choose the axis it is split on
+SPREAD_SAMPLE = 64
+
+
+def to_vector(lat, lon):
+    """Return the point on the unit sphere at a latitude and longitude"""
+    lat = math.radians(lat)
+    lon = math.radians(lon)
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+
+def chord_to_km(chord):
+    """Convert the straight line distance between two unit vectors to km"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def km_to_chord(km):
+    """Convert a great circle distance in km to the straight line distance"""
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Return the great circle distance between two points in km"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class KDTree:
+    """
+    A k-d tree over points on the unit sphere, stored as three coordinate
+    columns and a permutation of the point numbers. The tree is implicit:
+    each range of the permutation is split at its middle point along the axis
+    where the range is widest, and that axis is kept per split. Straight line
+    distance between unit vectors grows with great circle distance, so the
+    nearest points in 3D are the nearest on the globe
+    """
+
+    def __init__(self, vectors):
+        self.coords = tuple(array('d', column) for column in zip(*vectors)) or (
+            array('d'), array('d'), array('d'))
+        self.order = list(range(len(self.coords[0])))
+        self.axes = {}
+        self._build()
+
+    def _build(self):
+        stack = [(0, len(self.order))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                continue
+            points = self.order[lo:hi]
+            # The widest axis only needs to be roughly right, so it is judged
+            # from a sample of the range
+            sample = points[::max(1, len(points) // SPREAD_SAMPLE)]
+            spreads = [max(map(column.__getitem__, sample)) - min(map(column.__getitem__, sample))
+                       for column in self.coords]
+            axis = spreads.index(max(spreads))
+            points.sort(key=self.coords[axis].__getitem__)
+            self.order[lo:hi] = points
+            mid = (lo + hi) // 2
+            self.axes[mid] = axis
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+    def _squared(self, i, point):
+        x, y, z = self.coords
+        return (x[i] - point[0]) ** 2 + (y[i] - point[1]) ** 2 + (z[i] - point[2]) ** 2
+
+    def nearest(self, point, k=1):
+        """Return the (squared distance, point number) of the k nearest points"""
+        if k < 1:
+            return []
+        heap = []
+        self._nearest(point, k, heap, 0, len(self.order))
+        return sorted((-d, i) for d, i in heap)
+
+    def _nearest(self, point, k, heap, lo, hi):
+        if hi - lo <= LEAF_SIZE:
+            for i in self.order[lo:hi]:
+                d = self._squared(i, point)
+                if len(heap) < k:
+                    heapq.heappush(heap, (-d, i))
+                elif d < -heap[0][0]:
+                    heapq.heapreplace(heap, (-d, i))
+            return
+
+        mid = (lo + hi) // 2
+        i = self.order[mid]
+        axis = self.axes[mid]
+        diff = point[axis] - self.coords[axis][i]
+        near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+
+        self._nearest(point, k, heap, *near)
+        d = self._squared(i, point)
+        if len(heap) < k:
+            heapq.heappush(heap, (-d, i))
+        elif d < -heap[0][0]:
+            heapq.heapreplace(heap, (-d, i))
+        if len(heap) < k or diff * diff < -heap[0][0]:
+            self._nearest(point, k, heap, *far)
+
+    def within(self, point, radius):
+        """Return the (squared distance, point number) of every point within radius"""
+        found = []
+        limit = radius * radius
+        stack = [(0, len(self.order))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                for i in self.order[lo:hi]:
+                    d = self._squared(i, point)
+                    if d <= limit:
+                        found.append((d, i))
+                continue
+
+            mid = (lo + hi) // 2
+            i = self.order[mid]
+            axis = self.axes[mid]
+            diff = point[axis] - self.coords[axis][i]
+            d = self._squared(i, point)
+            if d <= limit:
+                found.append((d, i))
+            if diff <= radius:
+                stack.append((lo, mid))
+            if diff >= -radius:
+                stack.append((mid + 1, hi))
+        found.sort()
+        return found
+
+
+class GeoIndex:
+    """Nearest city and radius queries over city dictionaries from the city list"""
+
+    def __init__(self, cities):
+        self.cities = [city for city in cities
+                       if city["coord"]["lat"] is not None and city["coord"]["lon"] is not None]
+        self.tree = KDTree(to_vector(city["coord"]["lat"], city["coord"]["lon"])
+                           for city in self.cities)
+
+    def nearest(self, lat, lon, k=1):
+        """Return the k cities nearest to a point as (km, city) pairs, nearest first"""
+        found = self.tree.nearest(to_vector(lat, lon), k)
+        return [(chord_to_km(math.sqrt(d)), self.cities[i]) for d, i in found]
+
+    def within(self, lat, lon, km):
+        """Return every city within km of a point as (km, city) pairs, nearest first"""
+        found = self.tree.within(to_vector(lat, lon), km_to_chord(km))
+        return [(chord_to_km(math.sqrt(d)), self.cities[i]) for d, i in found]
@@ -1,16 +1,30 @@
-import json
-import requests
-from datetime import datetime
+import city_index
+import forecast_store
+import geo
+import profiling
+import search
 
 # Helper functions for data processing
 
 CITY_FILE = 'city.list.json'
+SEARCH_LIMIT = 10
+
+_city_search = None
+_geo_index = None
+
+# The 16 points of the compass, clockwise from north, and the size of the 
+# sector each one covers
+WIND_DIRECTIONS = ('N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+                   'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW')
+SECTOR = 22.5
+HALF_SECTOR = SECTOR / 2
 
 def verify_response(status_code):
     """
     Verify that the response from the API is good. If it is not, print the 
     possible reason and aid the user in correcting the problem
     """
+    profiling.count("status", status_code)
 
     if status_code == 200:                                                    
         return True                                                        
@@ -59,57 +73,131 @@ def same_name_cities(city_input):
     """
     same_name_list = None
     
-    # Attempt to open the file containing all the city information for the API
+    # Look the name up in the compiled city index, which is built from the
+    # file containing all the city information for the API on first use
     try:
-        with open(CITY_FILE, 'r', encoding="utf-8") as f:
-            city_list = json.load(f)
+        with profiling.stage("city"):
+            city_list = city_index.lookup_name(CITY_FILE, city_input)
     except FileNotFoundError:
         print("File Not Found: There may be an issue if there are multiple cities witht the same name.")
     else:
-        #same_name_list = [city for city in city_list if city["name"] == city_input]
-
         """
-        If the file is opened successfully check if each element loaded into 
-        city_list has a particular combination of keys that is already in 
-        seen. If not add the keys to the tuple key, add it to seen, and add the 
-        current dictionary in city list
+        If the lookup is successful check if each element in city_list has a 
+        particular combination of keys that is already in seen. If not add the 
+        keys to the tuple key, add it to seen, and add the current dictionary 
+        in city list
         """
         same_name_list = []
         seen = set()
 
         for city in city_list:
-            if city["name"] == city_input:
-                if city.get("state"):
-                    key = (city["name"], city["state"], city["country"])
-                    if key not in seen:
-                        seen.add(key)
-                        same_name_list.append(city)
-                else:
-                    key = (city["name"], city["country"])
-                    if key not in seen:
-                        seen.add(key)
-                        same_name_list.append(city)
+            if city.get("state"):
+                key = (city["name"], city["state"], city["country"])
+            else:
+                key = (city["name"], city["country"])
+            if key not in seen:
+                seen.add(key)
+                same_name_list.append(city)
          
     return same_name_list
 
 
-def verify_city_choice(city_list):
+def get_city_search():
+    """
+    Build the fuzzy search index over every city in the city index the first
+    time it is needed and reuse it for the rest of the process
+    """
+    global _city_search
+    if _city_search is None:
+        _city_search = search.CitySearch(city_index.all_cities(CITY_FILE),
+                                         city_index.folded_names(CITY_FILE))
+    return _city_search
+
+
+def search_cities(city_input, limit=SEARCH_LIMIT, country="US"):
+    """
+    Find the cities whose names most closely match the city the user entered,
+    allowing for typos, missing accents and partially entered names. Return a
+    list of city dictionaries ranked from best to worst match, or None if the
+    city file could not be found
+    """
+    try:
+        with profiling.stage("city"):
+            city_search = get_city_search()
+    except FileNotFoundError:
+        print("File Not Found: Unable to search for similar city names.")
+        return None
+    with profiling.stage("city"):
+        return city_search.search(city_input, limit, country)
+
+
+def parse_coordinates(text):
+    """
+    Return the latitude and longitude in text such as '40.71, -74.01', or
+    None if text is not a pair of coordinates
+    """
+    parts = text.replace(",", " ").split()
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def get_geo_index():
+    """
+    Build the spatial index over every city in the city index the first time
+    it is needed and reuse it for the rest of the process
+    """
+    global _geo_index
+    if _geo_index is None:
+        _geo_index = geo.GeoIndex(city_index.all_cities(CITY_FILE))
+    return _geo_index
+
+
+def nearby_cities(lat, lon, limit=1, radius=None):
+    """
+    Find the limit cities nearest to a latitude and longitude, only counting
+    cities within radius km if it is given. Return a list of (km, city) pairs,
+    nearest first, or None if the city file could not be found
+    """
+    try:
+        with profiling.stage("city"):
+            geo_index = get_geo_index()
+    except FileNotFoundError:
+        print("File Not Found: Unable to search for nearby cities.")
+        return None
+    with profiling.stage("city"):
+        if radius is None:
+            return geo_index.nearest(lat, lon, limit)
+        return geo_index.within(lat, lon, radius)[:limit]
+
+
+def verify_city_choice(city_list, exact=True):
     """
     If there were multiple cities with the same name display them for the user
     and prompt them to pick a city. Return the item of the list that the user 
     selects. The item will be a dictionary of non-weather information about the
-    city
+    city. If exact is False the list holds ranked suggestions for a name that
+    had no exact match
     """
-    print("\nThere are multiple cities matching you input.")
+    if exact:
+        print("\nThere are multiple cities matching you input.")
+    else:
+        print("\nNo exact match was found. The closest matches are listed first.")
 
     for i, city in enumerate(city_list, start=1):
         print(f"Enter {i} for:")   
-        print(f"\n\tCity: {city["name"]}")
+        print(f"\n\tCity: {city['name']}")
         if city.get("state"):
-            print(f"\tState: {city["state"]}")
-        print(f"\tCountry: {city["country"]}")
-        print(f"\tLatitude: {city["coord"]["lat"]}")
-        print(f"\tLongitude: {city["coord"]["lon"]}\n")
+            print(f"\tState: {city['state']}")
+        print(f"\tCountry: {city['country']}")
+        print(f"\tLatitude: {city['coord']['lat']}")
+        print(f"\tLongitude: {city['coord']['lon']}\n")
     
     choice = -1
     while True:
@@ -126,24 +214,23 @@ def verify_city_choice(city_list):
         
            
 
-def refine_date(weather_data_list, prompt):
+def refine_date(weather_data_list, prompt, store=None, utc_offset=None):
     """
     Get every unique date from the list of weather data and prompt the user
     for a particular day, or all data. Change the list of weather data in 
-    place to reflect the chosen date for the forecast.
+    place to reflect the chosen date for the forecast. store is a column store
+    of the same slots, built here if it is not given, with dates in the time
+    zone utc_offset seconds from UTC
     """ 
     choice = input(prompt)
-    choice_list = []
 
     if choice.lower() == 'y':
+        if store is None:
+            store = forecast_store.ForecastStore.from_slots(
+                weather_data_list, utc_offset=utc_offset)
 
-        # add each unique date to choice_list 
-        for i in range(len(weather_data_list)):
-
-            # convert the unix UTC time to a local, readable date
-            date = datetime.fromtimestamp(weather_data_list[i]['dt']).date()
-            if date not in choice_list:
-                choice_list.append(date)
+        # every unique local date, computed in one pass over the store
+        choice_list = store.dates()
         
         # print the menu for the date selection by the user
         for i, time in enumerate(choice_list, start=1):
@@ -163,74 +250,34 @@ def refine_date(weather_data_list, prompt):
 
         # Change list in place. Add all forecast data to the list where the date
         # matches the user's choice
-        weather_data_list[:] = [forecast for forecast in weather_data_list if datetime.fromtimestamp(forecast['dt']).date() == date_selected]
-        #print(len(weather_data_list))
-
-
-def get_sunrise(data):
-    """Get sunrise from fetched data for current weather or forecast"""
-    sys_dict = data['sys']
-    sunrise_unix_UTC = sys_dict.get('sunrise')
-    if sunrise_unix_UTC is None:
-        return None
-
-    readable_sunrise = datetime.fromtimestamp(sunrise_unix_UTC).time()
-    return readable_sunrise
+        weather_data_list[:] = filter_by_date(weather_data_list, date_selected, store)
 
 
-def get_sunset(data):
-    """Get sunset from fetched data for current weather or forecast"""        
-    sys_dict = data['sys']                                                      
-    sunset_unix_UTC = sys_dict.get('sunset')                                     
-    if sunset_unix_UTC is None:                                                
-        return None                                                             
-                                                                                
-    readable_sunset = datetime.fromtimestamp(sunset_unix_UTC).time()   
-    return readable_sunset
+def filter_by_date(weather_data_list, date, store=None, utc_offset=None):
+    """
+    Return the forecast slots in the list whose date is date, in the time zone
+    utc_offset seconds from UTC or the machine's if it is None
+    """
+    if store is None:
+        store = forecast_store.ForecastStore.from_slots(
+            weather_data_list, utc_offset=utc_offset)
+    return [weather_data_list[i] for i in store.day_rows(date)]
 
 
 def calculate_wind_direction(wind_degree):
     """
     Take the wind direction returned by the API (measured in degrees) and convert
-    it to a string representation of 16 point compass (17 in the case that the
-    direction is between 337.5 and 360)
-    """
-    wind_direction_dict = {'N': 0, 'NNE': 22.5, 'NE': 45, 'ENE': 67.5, 'E': 90,
-                           'ESE': 112.5, 'SE': 135, 'SSE': 157.5, 'S': 180, 
-                           'SSW': 202.5, 'SW': 225, 'WSW': 247.5, 'W': 270, 
-                           'WNW': 292.5, 'NW': 315, 'NNW': 337.5, 'N2': 360}
-
-    min_key = None
-    max_key = None
-    min_dict = {}
-    max_dict = {}
-    
-    wind_degree = wind_degree % 360
-    
-    # Figure out the two values that wind_degree falls between using 
-    # wind_direction_dict, save the keys, and add the key
-    for k, v in wind_direction_dict.items():
-        if wind_degree >= v:
-            min_dict[k] = v
-            min_key = k
-        else:
-            max_dict[k] = v
-            max_key = k
-            break
-
-    direction = None
-    
-    # Figure out which value wind_degree is closest to and save the key in the 
-    # variable direction
-    if wind_degree - min_dict[min_key] < max_dict[max_key] - wind_degree:
-        direction = min_key
-    else:
-        direction = max_key
-
-    # Since 0 and 360 is North, return 'N' id wind_degree is closer to 360
-    if direction == 'N2':
-        direction = 'N'
+    it to a string representation of 16 point compass. Each point covers the 
+    22.5 degree sector centered on it, so shifting by half a sector and dividing
+    gives the index of the point directly. A direction exactly between two 
+    points goes to the one clockwise of it
+    """
+    sector = int((wind_degree % 360 + HALF_SECTOR) // SECTOR) % 16
+    return WIND_DIRECTIONS[sector]
 
-    return direction
 
-    
+def wind_directions(wind_degrees):
+    """Convert a sequence of wind directions in degrees to compass points"""
+    directions, half, sector = WIND_DIRECTIONS, HALF_SECTOR, SECTOR
+    return [directions[int((degree % 360 + half) // sector) % 16]
+            for degree in wind_degrees]
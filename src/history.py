@@ -0,0 +1,143 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import models
+
+# A local time series of every observation and forecast fetched from the API
+
+HISTORY_FILE = 'weather_history.db'
+
+# Query parameters that identify a location
+LOCATION_PARAMS = ("id", "zip", "q", "lat", "lon")
+
+BUCKETS = {"hour": 60 * 60, "day": 24 * 60 * 60}
+
+COLUMNS = ("dt", "description", "temp", "feels_like", "temp_min", "temp_max",
+           "humidity", "wind_speed", "wind_deg", "clouds", "rain", "snow",
+           "visibility")
+
+
+@dataclass(slots=True)
+class Rollup:
+    """Values aggregated over one hour or day of a location's history"""
+    location: str
+    start: int
+    count: int
+    temp_min: float
+    temp_max: float
+    temp_mean: float
+    humidity_mean: float
+    wind_max: float
+    precipitation: float
+
+
+def location_key(params):
+    """
+    Build the key a location is stored under from the query parameters used
+    to fetch it, such as 'zip=10001,us' or 'id=2643743'
+    """
+    return "&".join(f"{k}={str(params[k]).strip().lower()}"
+                    for k in LOCATION_PARAMS if k in params)
+
+
+class History:
+    """
+    Observations stored in SQLite, keyed by (location, kind, dt). Storing the
+    same location, kind and time again replaces the earlier row, so repeated
+    fetches of an unchanged observation never duplicate it, while a newer
+    forecast for a slot replaces the older one
+    """
+
+    def __init__(self, filename=HISTORY_FILE):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS observations (
+                location TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                dt INTEGER NOT NULL,
+                fetched INTEGER NOT NULL,
+                description TEXT,
+                temp REAL, feels_like REAL, temp_min REAL, temp_max REAL,
+                humidity INTEGER, wind_speed REAL, wind_deg REAL, clouds INTEGER,
+                rain REAL, snow REAL, visibility INTEGER,
+                PRIMARY KEY (location, kind, dt)
+            ) WITHOUT ROWID""")
+
+    def append(self, location, kind, records, fetched=None):
+        """Store weather records for a location. kind is 'current' or 'forecast'"""
+        fetched = int(time.time()) if fetched is None else fetched
+        rows = [(location, kind, fetched, *(getattr(record, c) for c in COLUMNS))
+                for record in records]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO observations (location, kind, fetched, "
+                f"{', '.join(COLUMNS)}) VALUES ({', '.join('?' * (len(COLUMNS) + 3))})",
+                rows)
+
+    def locations(self):
+        """Return every location in the history with its row count and time span"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT location, kind, COUNT(*), MIN(dt), MAX(dt) FROM observations "
+                "GROUP BY location, kind ORDER BY location, kind").fetchall()
+
+    def _rows(self, sql, args):
+        """Yield the rows of a query in batches, without loading them all at once"""
+        with self.lock:
+            cursor = self.conn.execute(sql, args)
+            rows = cursor.fetchmany(500)
+        while rows:
+            yield from rows
+            with self.lock:
+                rows = cursor.fetchmany(500)
+
+    def query(self, location, start=None, end=None, kind="current"):
+        """Yield the records of a location with start <= dt < end, oldest first"""
+        start = 0 if start is None else start
+        end = 2 ** 62 if end is None else end
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM observations "
+               "WHERE location = ? AND kind = ? AND dt >= ? AND dt < ? ORDER BY dt")
+        for row in self._rows(sql, (location, kind, start, end)):
+            yield models.Conditions(*row)
+
+    def rollup(self, location, bucket="hour", start=None, end=None, kind="current"):
+        """
+        Yield an hourly or daily Rollup of a location's history, oldest first.
+        Buckets are aligned to UTC hours and days
+        """
+        size = BUCKETS[bucket]
+        start = 0 if start is None else start
+        end = 2 ** 62 if end is None else end
+        sql = ("SELECT (dt / ?) * ?, COUNT(*), MIN(temp), MAX(temp), AVG(temp), "
+               "AVG(humidity), MAX(wind_speed), "
+               "SUM(COALESCE(rain, 0) + COALESCE(snow, 0)) FROM observations "
+               "WHERE location = ? AND kind = ? AND dt >= ? AND dt < ? "
+               "GROUP BY dt / ? ORDER BY 1")
+        for row in self._rows(sql, (size, size, location, kind, start, end, size)):
+            bucket_start, count, t_min, t_max, t_mean, h_mean, w_max, precip = row
+            yield Rollup(location, bucket_start, count, t_min, t_max,
+                         round(t_mean, 1), round(h_mean, 1), w_max, round(precip, 2))
+
+    def close(self):
+        self.conn.close()
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    """
+    Return the history store shared by the whole process. It is created under
+    a lock, so threads that ask for it at the same time all get the same one
+    """
+    global _history
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                _history = History()
+    return _history
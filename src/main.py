@@ -1,14 +1,31 @@
+import argparse
+import sys
+from datetime import datetime
 import ui_helpers
 import config
 import fetch
+import profiling
+import snapshot
 
 
-def main():
+def main(offline=None):
 
     print("\nWelcome to CLI-Mate!" 
           "\nA simple weather fetching application written in Python")
 
-    settings = config.load_settings()
+    profiling.enable_from_env()
+    with profiling.stage("settings"):
+        settings = config.load_settings()
+
+    # Offline, weather is read from a snapshot saved by the export command
+    if offline:
+        try:
+            saved = snapshot.use_snapshot(offline)
+        except (OSError, ValueError) as e:
+            print(f"Unable to read the snapshot {offline}: {e}")
+            return
+        print(f"\nOffline: showing weather saved at "
+              f"{datetime.fromtimestamp(saved.created)} in {offline}")
 
     while True:
         ui_helpers.print_menu()
@@ -29,5 +46,29 @@ def main():
         else:
             print("INVALID INPUT")
             
+def parse_args(argv):
+    """
+    Split the arguments into the snapshot to read offline and a command line
+    for cli, which is empty when the menu should be shown. Only --offline is
+    handled here, anywhere on the line; everything else is left to cli. A
+    command name given after --offline is the command, not the snapshot
+    """
+    import cli
+
+    parser = argparse.ArgumentParser(prog="main.py", add_help=False)
+    parser.add_argument("--offline", nargs="?", const=snapshot.SNAPSHOT_FILE)
+    args, command = parser.parse_known_args(argv)
+    if args.offline in cli.COMMANDS:
+        command.insert(0, args.offline)
+        args.offline = snapshot.SNAPSHOT_FILE
+    return args.offline, command
+
+
 if __name__ == '__main__':
-    main()
+    offline, command = parse_args(sys.argv[1:])
+    if command:
+        import cli
+        if offline:
+            command += ["--offline", offline]
+        sys.exit(cli.main(command))
+    main(offline)
@@ -0,0 +1,269 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# A local stand-in for the OpenWeather API, for testing and benchmarks
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+API_PATH = "/data/2.5"
+
+# The most city IDs the group endpoint accepts
+GROUP_SIZE = 20
+
+
+def load_fixture(name):
+    """Load a recorded response from the fixtures directory"""
+    with open(os.path.join(FIXTURE_DIR, name), 'r', encoding="utf-8") as f:
+        return json.load(f)
+
+
+class MockAPI:
+    """
+    Replays recorded responses for the current weather, forecast and group
+    endpoints.
+    Latency, random errors and a rate limit can be added to imitate the real
+    service under load. Good responses carry an ETag and Last-Modified time,
+    and are compressed for clients that accept gzip, unless turned off
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_codes=(500,), requests_per_minute=None, api_key=None,
+                 etags=True, compress=True):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.requests_per_minute = requests_per_minute
+        self.api_key = api_key
+        self.etags = etags
+        self.compress = compress
+        self.last_modified = formatdate(time.time(), usegmt=True)
+
+        self.weather = load_fixture('weather.json')
+        self.forecast = load_fixture('forecast.json')
+        self.cities = load_fixture('city.list.json')
+        self.cities_by_id = {city["id"]: city for city in self.cities}
+
+        self.lock = threading.Lock()
+        self.request_times = []
+        self.counts = {}
+        self.bytes_sent = 0
+
+    def _rate_limited(self, now):
+        """Record a request and return True if it goes over the rate limit"""
+        if not self.requests_per_minute:
+            return False
+        with self.lock:
+            self.request_times = [t for t in self.request_times if now - t < 60]
+            if len(self.request_times) >= self.requests_per_minute:
+                return True
+            self.request_times.append(now)
+            return False
+
+    def _find_city(self, params):
+        """Find the fixture city a request asks for, or None"""
+        if "id" in params:
+            try:
+                return self.cities_by_id.get(int(params["id"]))
+            except ValueError:
+                return None
+        if "q" in params:
+            name, *rest = [part.strip() for part in params["q"].split(",")]
+            for city in self.cities:
+                if city["name"].lower() == name.lower() and (
+                        not rest or rest[-1].upper() == city["country"]):
+                    return city
+            return None
+        if "lat" in params and "lon" in params:
+            lat, lon = float(params["lat"]), float(params["lon"])
+            return min(self.cities, key=lambda city: (city["coord"]["lat"] - lat) ** 2
+                       + (city["coord"]["lon"] - lon) ** 2)
+        if "zip" in params:
+            code = params["zip"].split(",")[0]
+            return self.cities[0] if code.isdigit() and len(code) == 5 else None
+        return None
+
+    def _weather_for(self, city):
+        data = dict(self.weather, id=city["id"], name=city["name"],
+                    coord=city["coord"])
+        data["sys"] = dict(data["sys"], country=city["country"])
+        return data
+
+    def _forecast_for(self, city, count=None):
+        data = dict(self.forecast)
+        if count:
+            data["list"] = data["list"][:count]
+            data["cnt"] = len(data["list"])
+        data["city"] = dict(data["city"], id=city["id"], name=city["name"],
+                            coord=city["coord"], country=city["country"])
+        return data
+
+    def _group_item(self, city):
+        """
+        Return a city's weather the way the group endpoint lists it, with its
+        UTC offset in sys and without the fields only single reports carry
+        """
+        data = self._weather_for(city)
+        sys_dict = data["sys"]
+        data["sys"] = {"country": sys_dict.get("country"),
+                       "timezone": data.pop("timezone", None),
+                       "sunrise": sys_dict.get("sunrise"), "sunset": sys_dict.get("sunset")}
+        for key in ("base", "cod"):
+            data.pop(key, None)
+        return data
+
+    def _group(self, params):
+        """Answer a request for the current weather of several city IDs"""
+        try:
+            city_ids = [int(city_id) for city_id in params.get("id", "").split(",")]
+        except ValueError:
+            return 400, {}, {"cod": "400", "message": "id is not a number"}
+        if len(city_ids) > GROUP_SIZE:
+            return 400, {}, {"cod": "400", "message": "too many ids"}
+        found = [self._group_item(self.cities_by_id[city_id])
+                 for city_id in city_ids if city_id in self.cities_by_id]
+        return 200, {}, {"cnt": len(found), "list": found}
+
+    def handle(self, path, params):
+        """Return the status code, headers and body for a request"""
+        now = time.monotonic()
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if self._rate_limited(now):
+            return 429, {"Retry-After": "1"}, {"cod": 429, "message": "rate limit exceeded"}
+        if self.error_rate and random.random() < self.error_rate:
+            code = random.choice(self.error_codes)
+            return code, {}, {"cod": code, "message": "injected error"}
+        if self.api_key is not None and params.get("appid") != self.api_key:
+            return 401, {}, {"cod": 401, "message": "Invalid API key."}
+
+        endpoint = path[len(API_PATH) + 1:] if path.startswith(API_PATH + "/") else None
+        if endpoint not in ("weather", "forecast", "group"):
+            return 404, {}, {"cod": 404, "message": "Internal error"}
+        if endpoint == "group":
+            return self._group(params)
+        if not any(key in params for key in ("q", "zip", "id", "lat")):
+            return 400, {}, {"cod": "400", "message": "Nothing to geocode"}
+
+        city = self._find_city(params)
+        if city is None:
+            return 404, {}, {"cod": "404", "message": "city not found"}
+        if endpoint == "weather":
+            return 200, {}, self._weather_for(city)
+        count = params.get("cnt")
+        return 200, {}, self._forecast_for(city, int(count) if count and count.isdigit() else None)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        api = self.server.api
+        status, headers, body = api.handle(url.path, params)
+        headers = dict(headers)
+        payload = json.dumps(body).encode("utf-8")
+
+        if status == 200 and api.etags:
+            etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+            headers["ETag"] = etag
+            headers["Last-Modified"] = api.last_modified
+            if_none_match = self.headers.get("If-None-Match")
+            if (if_none_match == etag if if_none_match
+                    else self.headers.get("If-Modified-Since") == api.last_modified):
+                status, payload = 304, b""
+        if payload and api.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+            payload = gzip.compress(payload)
+            headers["Content-Encoding"] = "gzip"
+
+        with api.lock:
+            api.counts[status] = api.counts.get(status, 0) + 1
+            api.bytes_sent += len(payload)
+
+        self.send_response(status)
+        if status != 304:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer:
+    """Run a MockAPI on a local port in a background thread"""
+
+    def __init__(self, api=None, host="127.0.0.1", port=0):
+        self.api = api or MockAPI()
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.api = self.api
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """The address to use in place of the real API's"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{API_PATH}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the OpenWeather API")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests that fail with one of --error-codes")
+    parser.add_argument("--error-codes", type=lambda s: [int(c) for c in s.split(",")],
+                        default=[500], help="comma separated status codes (default: 500)")
+    parser.add_argument("--rpm", type=int, help="requests per minute before answering 429")
+    parser.add_argument("--api-key", help="answer 401 unless this key is used")
+    parser.add_argument("--no-etags", action="store_true",
+                        help="never send ETag or Last-Modified, or answer 304")
+    parser.add_argument("--no-gzip", action="store_true", help="never compress responses")
+    args = parser.parse_args(argv)
+
+    api = MockAPI(args.latency, args.jitter, args.error_rate, args.error_codes,
+                  args.rpm, args.api_key, not args.no_etags, not args.no_gzip)
+    server = MockServer(api, port=args.port)
+    print(f"Serving the OpenWeather stand-in at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+from dataclasses import dataclass, asdict
+
+import profiling
+import stream
+
+# Compact records parsed from the data returned by the OpenWeather API
+
+
+@dataclass(slots=True)
+class City:
+    """A city as described by the forecast endpoint or the city list"""
+    id: int | None
+    name: str
+    country: str = ""
+    state: str = ""
+    lat: float | None = None
+    lon: float | None = None
+    timezone: int = 0
+
+
+@dataclass(slots=True)
+class Conditions:
+    """The weather conditions shared by observations and forecast slots"""
+    dt: int
+    description: str
+    temp: float
+    feels_like: float
+    temp_min: float
+    temp_max: float
+    humidity: int
+    wind_speed: float
+    wind_deg: float
+    clouds: int
+    rain: float | None = None
+    snow: float | None = None
+    visibility: int | None = None
+
+
+@dataclass(slots=True)
+class Observation(Conditions):
+    """Current weather reported for a location"""
+    name: str = ""
+    city_id: int | None = None
+    sunrise: int | None = None
+    sunset: int | None = None
+    timezone: int | None = None
+
+
+@dataclass(slots=True)
+class ForecastSlot(Conditions):
+    """The forecast for one 3 hour slot"""
+    pop: float = 0.0
+
+
+def _precipitation(data, key):
+    """Return the rain or snow for the last hour, or the last 3 hours if that is all there is"""
+    amounts = data.get(key)
+    if not amounts:
+        return None
+    amount = amounts.get('1h')
+    if amount is None:
+        amount = amounts.get('3h')
+    return amount
+
+
+def _conditions(data):
+    """Return the fields shared by observations and forecast slots as a tuple"""
+    main = data['main']
+    wind = data['wind']
+    return (data['dt'], data['weather'][0]['description'], main['temp'],
+            main['feels_like'], main['temp_min'], main['temp_max'],
+            main['humidity'], wind['speed'], wind.get('deg', 0),
+            data['clouds']['all'], _precipitation(data, 'rain'),
+            _precipitation(data, 'snow'), data.get('visibility'))
+
+
+def parse_observation(data):
+    """
+    Parse a response from the current weather endpoint, or one item of the
+    group endpoint's list, which carries its UTC offset in sys instead
+    """
+    with profiling.stage("parse"):
+        sys_dict = data.get('sys', {})
+        return Observation(*_conditions(data), name=data.get('name', ""),
+                           city_id=data.get('id'), sunrise=sys_dict.get('sunrise'),
+                           sunset=sys_dict.get('sunset'),
+                           timezone=data.get('timezone', sys_dict.get('timezone')))
+
+
+def parse_slot(data):
+    """Parse one entry of the list returned by the forecast endpoint"""
+    return ForecastSlot(*_conditions(data), pop=data.get('pop', 0.0))
+
+
+def parse_city(data):
+    """Parse the city returned by the forecast endpoint"""
+    coord = data.get('coord', {})
+    return City(data.get('id'), data['name'], data.get('country', ""),
+                data.get('state', ""), coord.get('lat'), coord.get('lon'),
+                data.get('timezone', 0))
+
+
+def parse_forecast(data):
+    """Parse a response from the forecast endpoint into its city and slots"""
+    with profiling.stage("parse"):
+        return parse_city(data['city']), [parse_slot(slot) for slot in data['list']]
+
+
+def parse_forecast_stream(chunks):
+    """
+    Parse a forecast response from an iterable of text or bytes chunks. Each
+    slot is parsed as soon as it is read, so the decoded response is never
+    held in memory as a whole
+    """
+    city = None
+    slots = []
+    for key, value in stream.iter_object(chunks, ("list",)):
+        if key == "list":
+            slots.append(parse_slot(value))
+        elif key == "city":
+            city = parse_city(value)
+    return city, slots
+
+
+def to_dict(record):
+    """Return a record as a plain dictionary, ready to be exported as JSON"""
+    return asdict(record)
@@ -0,0 +1,117 @@
+import atexit
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+# Opt in timings of each stage of a request, with counters, reported at exit
+
+ENV_VAR = 'CLIMATE_TIMINGS'
+
+# The stages timed, in the order a request goes through them
+STAGES = ("settings", "city", "network", "decode", "parse", "render")
+
+enabled = False
+stage_seconds = Counter()
+stage_calls = Counter()
+counters = Counter()
+
+# Handed out by stage while timing is off, so a disabled stage costs one call
+_NOOP = nullcontext()
+
+
+class _Timer:
+    """Add the time spent inside a with block to a stage"""
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stage_seconds[self.name] += time.perf_counter() - self.start
+        stage_calls[self.name] += 1
+        return False
+
+
+def stage(name):
+    """Return a context manager that times a stage if timing is on"""
+    if not enabled:
+        return _NOOP
+    return _Timer(name)
+
+
+def count(name, label):
+    """Count an event, such as a cache hit or an API status code, if timing is on"""
+    if enabled:
+        counters[name, label] += 1
+
+
+def enable(output="-"):
+    """
+    Turn timing on and report it when the process exits. output is '-' for a
+    summary on stderr, or the name of a file to write Prometheus metrics to
+    """
+    global enabled
+    if not enabled:
+        enabled = True
+        atexit.register(dump, output)
+
+
+def enable_from_env():
+    """Turn timing on if the environment asks for it"""
+    value = os.environ.get(ENV_VAR)
+    if value:
+        enable("-" if value in ("1", "-") else value)
+
+
+def _ordered_stages():
+    return [name for name in STAGES if name in stage_calls] + sorted(
+        name for name in stage_calls if name not in STAGES)
+
+
+def summary():
+    """Return the timings and counters as lines of text for people"""
+    lines = ["stage        calls   total ms    mean ms"]
+    for name in _ordered_stages():
+        seconds, calls = stage_seconds[name], stage_calls[name]
+        lines.append(f"{name:<10} {calls:7} {seconds * 1000:10.2f} "
+                     f"{seconds * 1000 / calls:10.3f}")
+    for (name, label), value in sorted(counters.items()):
+        lines.append(f"{name}={label} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def prometheus():
+    """Return the timings and counters in the Prometheus text format"""
+    lines = ["# HELP climate_stage_seconds_total Time spent in each stage.",
+             "# TYPE climate_stage_seconds_total counter"]
+    lines += [f'climate_stage_seconds_total{{stage="{name}"}} {stage_seconds[name]:.6f}'
+              for name in _ordered_stages()]
+    lines += ["# HELP climate_stage_calls_total Times each stage ran.",
+              "# TYPE climate_stage_calls_total counter"]
+    lines += [f'climate_stage_calls_total{{stage="{name}"}} {stage_calls[name]}'
+              for name in _ordered_stages()]
+
+    labels = {"cache": "result", "snapshot": "result", "status": "code"}
+    for name in sorted({name for name, _ in counters}):
+        metric = f"climate_{name}_total"
+        lines += [f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{{labels.get(name, "label")}="{label}"}} {value}'
+                  for (counter, label), value in sorted(counters.items()) if counter == name]
+    return "\n".join(lines) + "\n"
+
+
+def dump(output="-"):
+    """Write the summary to stderr, or the metrics to a file, replacing it whole"""
+    if output == "-":
+        sys.stderr.write(summary())
+        return
+    tmp_file = f"{output}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding="utf-8") as f:
+        f.write(prometheus())
+    os.replace(tmp_file, output)
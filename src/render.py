@@ -0,0 +1,181 @@
+import csv
+import io
+import sys
+from datetime import datetime
+
+import helpers
+import timezones
+
+# Layouts for weather output, compiled once and rendered into a single buffer
+
+RULE = "-" * 29
+
+# Each layout is a sequence of (template, condition) lines. A line is only
+# written if condition is None or the record's value for it is truthy
+FULL_LAYOUT = (
+    ("\nWEATHER for {name_upper} - {time}", None),
+    (RULE, None),
+    ("Date: {today}", None),
+    ("Description: {description}", None),
+    ("Current Temperature: {temp}", None),
+    ("Feels Like: {feels_like}", None),
+    ("Temperature Variance: +{max_var}, -{min_var}", None),
+    ("Humidity: {humidity}%", None),
+    ("Wind Speed: {wind_speed}mph", None),
+    ("Wind Direction: {wind_dir}", None),
+    ("Rainfall: {rain}mm/h", "rain"),
+    ("Snowfall: {snow}mm/h", "snow"),
+    ("Cloud Coverage: {clouds}%", None),
+    ("Visibility: {visibility_km}km", "visibility"),
+    ("Sunrise: {sunrise}", "sunrise"),
+    ("Sunset: {sunset}", "sunset"),
+    (RULE, None),
+)
+
+LINE_LAYOUT = (
+    ("{name_token} {iso_time} temp={temp} feels={feels_like} humidity={humidity} "
+     "wind={wind_speed} dir={wind_dir} clouds={clouds} desc={desc_token}", None),
+)
+
+TABLE_HEADER = (f"{'City':<16} {'Time':<19} {'Temp':>6} {'Feels':>6} {'Hum%':>4} "
+                f"{'Wind':>5} {'Dir':<3} {'Cld%':>4} Description")
+TABLE_LAYOUT = (
+    ("{name:<16.16} {time!s:<19} {temp:>6} {feels_like:>6} {humidity:>4} "
+     "{wind_speed:>5} {wind_dir:<3} {clouds:>4} {description}", None),
+)
+
+CSV_FIELDS = ("name", "time", "description", "temp", "feels_like", "temp_min",
+              "temp_max", "humidity", "wind_speed", "wind_dir", "rain", "snow",
+              "clouds", "visibility", "sunrise", "sunset")
+
+
+def compile_layout(layout):
+    """
+    Compile a layout into as few templates as possible. Consecutive lines
+    that are always written are joined into one template, so a record is
+    formatted with a handful of format_map calls instead of one per line
+    """
+    compiled = []
+    run = []
+    for template, condition in layout:
+        if condition is None:
+            run.append(template)
+            continue
+        if run:
+            compiled.append(("\n".join(run) + "\n", None))
+            run = []
+        compiled.append((template + "\n", condition))
+    if run:
+        compiled.append(("\n".join(run) + "\n", None))
+    return tuple(compiled)
+
+
+def record_values(record, name, today, local=None):
+    """
+    Return every value a layout can use for a record. local is the record's
+    LocalTimes. If it is not given it is converted here with the record's own
+    timezone, or in the machine's time zone if the record has none
+    """
+    if local is None:
+        local = timezones.local_times([record])[0]
+    city_name = getattr(record, "name", "") or name
+    readable_time_of_calc = local.time
+    visibility = record.visibility
+    return {
+        "name": city_name,
+        "name_upper": city_name.upper(),
+        "name_token": city_name.replace(" ", "_"),
+        "time": readable_time_of_calc,
+        "iso_time": readable_time_of_calc.isoformat(),
+        "today": today,
+        "description": record.description,
+        "desc_token": record.description.replace(" ", "_"),
+        "temp": record.temp,
+        "feels_like": record.feels_like,
+        "temp_min": record.temp_min,
+        "temp_max": record.temp_max,
+        "max_var": round(record.temp_max - record.temp, 1),
+        "min_var": round(record.temp - record.temp_min, 1),
+        "humidity": record.humidity,
+        "wind_speed": record.wind_speed,
+        "wind_dir": helpers.calculate_wind_direction(record.wind_deg),
+        "rain": record.rain,
+        "snow": record.snow,
+        "clouds": record.clouds,
+        "visibility": visibility,
+        "visibility_km": visibility / 1000.0 if visibility else None,
+        "sunrise": local.sunrise,
+        "sunset": local.sunset,
+    }
+
+
+class Renderer:
+    """
+    Render weather records with one of the layouts in LAYOUTS. All of the
+    records passed to render are built into one string, which write sends
+    to the stream in a single call
+    """
+
+    def __init__(self, layout="full"):
+        self.layout = layout
+        if layout != "csv":
+            self.templates = compile_layout(LAYOUTS[layout])
+
+    def header(self):
+        """Return the header line of the layout, if it has one"""
+        if self.layout == "table":
+            return TABLE_HEADER + "\n"
+        if self.layout == "csv":
+            return ",".join(CSV_FIELDS) + "\r\n"
+        return ""
+
+    def render(self, records, name="", header=True, utc_offset=None):
+        """
+        Return the records rendered as a single string. Times are shown in the
+        time zone utc_offset seconds from UTC, or each record's own timezone
+        """
+        today = datetime.today().date()
+        records = list(records)
+        local_times = timezones.local_times(records, utc_offset)
+        buffer = io.StringIO()
+        if header:
+            buffer.write(self.header())
+
+        if self.layout == "csv":
+            writer = csv.writer(buffer)
+            for record, local in zip(records, local_times):
+                values = record_values(record, name, today, local)
+                writer.writerow([values[field] for field in CSV_FIELDS])
+            return buffer.getvalue()
+
+        templates = self.templates
+        write = buffer.write
+        for record, local in zip(records, local_times):
+            values = record_values(record, name, today, local)
+            for template, condition in templates:
+                if condition is None or values[condition]:
+                    write(template.format_map(values))
+        return buffer.getvalue()
+
+    def write(self, records, stream=None, name="", header=True, utc_offset=None):
+        """Render the records and write them to stream, stdout by default"""
+        stream = sys.stdout if stream is None else stream
+        stream.write(self.render(records, name, header, utc_offset))
+
+
+LAYOUTS = {
+    "full": FULL_LAYOUT,
+    "line": LINE_LAYOUT,
+    "table": TABLE_LAYOUT,
+    "csv": None,
+}
+
+_renderers = {}
+
+
+def get_renderer(layout="full"):
+    """Return the compiled renderer for a layout, compiling it on first use"""
+    renderer = _renderers.get(layout)
+    if renderer is None:
+        renderer = _renderers[layout] = Renderer(layout)
+    return renderer
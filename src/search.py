@@ -0,0 +1,124 @@
+import heapq
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+# Fuzzy and prefix search over the city list
+
+EXACT_BONUS = 1.0
+PREFIX_BONUS = 0.5
+COUNTRY_BONUS = 0.05
+
+# Trigrams shared by more names than this are too common to help rank, so
+# they are skipped when collecting candidates for a query
+MAX_POSTINGS = 5000
+
+
+def fold(text):
+    """
+    Fold a name for comparison. Accents are removed, case is folded and runs
+    of whitespace are collapsed, so 'São  Paulo' and 'sao paulo' are equal
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def trigrams(folded):
+    """Return the set of trigrams of a folded name, padded to mark its ends"""
+    padded = f"  {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CitySearch:
+    """
+    An in memory index over a list of cities. Every distinct folded name is
+    stored once, with a trigram index for fuzzy matches and a sorted name
+    table for prefix matches. Names already folded, such as those stored in
+    the city index, can be passed in to skip folding them again
+    """
+
+    def __init__(self, cities, folded_names=None):
+        self.cities = list(cities)
+        if folded_names is None:
+            folded_names = [fold(city["name"]) for city in self.cities]
+
+        name_ids = {}
+        self.name_cities = []
+        for i, folded in enumerate(folded_names):
+            name_id = name_ids.get(folded)
+            if name_id is None:
+                name_id = name_ids[folded] = len(self.name_cities)
+                self.name_cities.append([])
+            self.name_cities[name_id].append(i)
+
+        self.names = list(name_ids)
+        self.gram_counts = []
+        postings = defaultdict(list)
+        for name_id, folded in enumerate(self.names):
+            grams = trigrams(folded)
+            self.gram_counts.append(len(grams))
+            for gram in grams:
+                postings[gram].append(name_id)
+        self.postings = dict(postings)
+
+        self.sorted_names = sorted((folded, name_id) for folded, name_id in name_ids.items())
+
+    def _prefix_ids(self, folded, limit):
+        """Return up to limit name ids whose folded name starts with folded"""
+        ids = []
+        i = bisect_left(self.sorted_names, (folded, -1))
+        while i < len(self.sorted_names) and len(ids) < limit:
+            name, name_id = self.sorted_names[i]
+            if not name.startswith(folded):
+                break
+            ids.append(name_id)
+            i += 1
+        return ids
+
+    def search(self, query, limit=10, country=None):
+        """
+        Return up to limit cities ranked by how closely their name matches
+        query. Exact matches rank first, then names starting with query, then
+        names sharing the most trigrams with it. Cities in country, when given,
+        are ranked slightly higher than otherwise equal matches
+        """
+        folded = fold(query)
+        if not folded:
+            return []
+
+        query_grams = trigrams(folded)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            ids = self.postings.get(gram, ())
+            if len(ids) > MAX_POSTINGS:
+                continue
+            for name_id in ids:
+                shared[name_id] += 1
+
+        scores = {}
+        for name_id, count in shared.items():
+            union = len(query_grams) + self.gram_counts[name_id] - count
+            scores[name_id] = count / union
+
+        for name_id in self._prefix_ids(folded, limit * 4):
+            scores[name_id] = scores.get(name_id, 0.0) + PREFIX_BONUS
+            if self.names[name_id] == folded:
+                scores[name_id] += EXACT_BONUS
+
+        best_names = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+        ranked = []
+        seen = set()
+        for name_id, score in best_names:
+            for i in self.name_cities[name_id]:
+                city = self.cities[i]
+                key = (city["name"], city.get("state"), city["country"])
+                if key in seen:
+                    continue
+                seen.add(key)
+                bonus = COUNTRY_BONUS if country and city["country"] == country else 0.0
+                ranked.append((score + bonus, len(city["name"]), len(ranked), city))
+
+        ranked.sort(key=lambda item: (-item[0], item[1], item[2]))
+        return [city for *_, city in ranked[:limit]]
@@ -0,0 +1,211 @@
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from dataclasses import fields
+from operator import attrgetter
+
+import city_index
+import history
+import models
+import profiling
+
+# Weather for many locations saved to one file, so it can be read offline
+
+SNAPSHOT_FILE = 'weather.snapshot'
+
+MAGIC = b'CLIMSNAP'
+VERSION = 1
+
+# The start of the file: the magic, the format version and when it was made
+HEADER = struct.Struct('<8sHq')
+
+# The end of the file: where the index starts, its length and the magic again
+TRAILER = struct.Struct('<QQ8s')
+
+COMPRESS_LEVEL = 6
+
+# Records are stored as rows of field values in the order the records take
+# them, which is smaller than field names and much faster than astuple
+_observation_row = attrgetter(*(field.name for field in fields(models.Observation)))
+_city_row = attrgetter(*(field.name for field in fields(models.City)))
+_slot_row = attrgetter(*(field.name for field in fields(models.ForecastSlot)))
+
+_snapshot = None
+
+
+def snapshot_key(endpoint, params):
+    """Build the key a response is stored under, such as 'weather:zip=10001,us'"""
+    return f"{endpoint}:{history.location_key(params)}"
+
+
+class SnapshotWriter:
+    """
+    Write a snapshot. Every response is compressed on its own and appended as
+    a blob, so reading one location never decompresses any other. The index of
+    keys to blobs is written last, followed by a fixed size trailer that points
+    back to it. The file is written under a temporary name and only replaces
+    the old snapshot once it is complete
+    """
+
+    def __init__(self, filename=SNAPSHOT_FILE):
+        self.filename = filename
+        self.tmp_file = f"{filename}.{os.getpid()}.tmp"
+        self.f = open(self.tmp_file, 'wb')
+        self.f.write(HEADER.pack(MAGIC, VERSION, int(time.time())))
+        self.entries = {}
+        self.cities = None
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+            os.remove(self.tmp_file)
+        return False
+
+    def _blob(self, data):
+        """Compress and append bytes, returning where they were written"""
+        compressed = zlib.compress(data, COMPRESS_LEVEL)
+        offset = self.f.tell()
+        self.f.write(compressed)
+        return [offset, len(compressed)]
+
+    def _add(self, endpoint, keys, data):
+        blob = self._blob(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        for params in keys:
+            self.entries[snapshot_key(endpoint, params)] = blob
+        self.count += 1
+
+    def add_weather(self, params, record):
+        """
+        Store the current weather Observation for the location params asked
+        for. It can also be found by its city ID
+        """
+        keys = [params]
+        if record.city_id:
+            keys.append({"id": record.city_id})
+        self._add("weather", keys, _observation_row(record))
+
+    def add_forecast(self, params, city, slots):
+        """Store a parsed forecast for the location params asked for, and its city ID"""
+        keys = [params]
+        if city.id:
+            keys.append({"id": city.id})
+        self._add("forecast", keys, {"city": _city_row(city),
+                                     "slots": [_slot_row(slot) for slot in slots]})
+
+    def add_city_index(self, data):
+        """Store the bytes of the city index, so cities can be looked up offline"""
+        self.cities = self._blob(data)
+
+    def close(self):
+        index = {"entries": self.entries, "cities": self.cities}
+        offset, length = self._blob(json.dumps(index).encode("utf-8"))
+        self.f.write(TRAILER.pack(offset, length, MAGIC))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        os.replace(self.tmp_file, self.filename)
+
+
+class Snapshot:
+    """
+    Read a snapshot through a memory map. Only the header, trailer and index
+    are read when it is opened. Looking a location up finds its blob in the
+    index and decompresses just that range of the file, which the operating
+    system pages in on demand
+    """
+
+    def __init__(self, filename=SNAPSHOT_FILE):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{filename} is empty") from None
+
+        if len(self.map) < HEADER.size + TRAILER.size:
+            raise ValueError(f"{filename} is not a CLI-Mate snapshot")
+        magic, version, self.created = HEADER.unpack_from(self.map, 0)
+        offset, length, end_magic = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        if magic != MAGIC or end_magic != MAGIC:
+            raise ValueError(f"{filename} is not a CLI-Mate snapshot")
+        if version != VERSION:
+            raise ValueError(f"{filename} is a version {version} snapshot, "
+                             f"but only version {VERSION} can be read")
+
+        # A damaged file can still have both magics, so an index that does not
+        # decompress or decode into the expected shape means the same thing
+        try:
+            index = json.loads(self._read([offset, length]))
+            self.entries = index["entries"]
+            self.cities = index["cities"]
+        except (zlib.error, ValueError, KeyError, TypeError):
+            self.map.close()
+            raise ValueError(f"{filename} is not a CLI-Mate snapshot") from None
+
+    def __len__(self):
+        return len({tuple(blob) for blob in self.entries.values()})
+
+    def _read(self, blob):
+        offset, length = blob
+        return zlib.decompress(self.map[offset:offset + length])
+
+    def _lookup(self, endpoint, params):
+        blob = self.entries.get(snapshot_key(endpoint, params))
+        profiling.count("snapshot", "miss" if blob is None else "hit")
+        return None if blob is None else json.loads(self._read(blob))
+
+    def weather(self, params):
+        """Return the current weather Observation saved for a location, or None"""
+        row = self._lookup("weather", params)
+        return None if row is None else models.Observation(*row)
+
+    def forecast(self, params):
+        """
+        Return the forecast saved for a location as its city and slots, or
+        None. The slots are cut to params['cnt'] if the request limits them
+        """
+        data = self._lookup("forecast", {k: v for k, v in params.items() if k != "cnt"})
+        if data is None:
+            return None
+        slots = [models.ForecastSlot(*row) for row in data["slots"]]
+        if params.get("cnt"):
+            slots = slots[:int(params["cnt"])]
+        return models.City(*data["city"]), slots
+
+    def city_index(self):
+        """Return the bytes of the saved city index, or None if there is none"""
+        return None if self.cities is None else self._read(self.cities)
+
+    def close(self):
+        self.map.close()
+
+
+def use_snapshot(filename=SNAPSHOT_FILE):
+    """
+    Read weather from a snapshot instead of the API for the rest of the
+    process, and look cities up in its city index. Raises OSError if the file
+    cannot be read and ValueError if it is not a snapshot
+    """
+    global _snapshot
+    snapshot = Snapshot(filename)
+    data = snapshot.city_index()
+    if data is not None:
+        city_index.load_index(data)
+    if _snapshot is not None:
+        _snapshot.close()
+    _snapshot = snapshot
+    return snapshot
+
+
+def current():
+    """Return the snapshot being read from, or None when online"""
+    return _snapshot
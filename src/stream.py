@@ -0,0 +1,142 @@
+import codecs
+import json
+import re
+
+# Incremental JSON reading, one record at a time, from files or responses
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+# Text that may still be part of a number when it reaches the end of the buffer
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+
+class _Reader:
+    """
+    Hold a small window of JSON text fed from an iterable of chunks. Only the
+    text of the value being decoded is kept, so memory stays flat no matter
+    how large the whole document is
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.done = False
+
+    def _fill(self):
+        """Append the next chunk to the buffer. Return False at the end of input"""
+        if self.done:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.done = True
+            chunk = self.utf8.decode(b"", final=True)
+        elif isinstance(chunk, bytes):
+            chunk = self.utf8.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at the end"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        """Consume char, which must be the next character"""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON but found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """
+        Decode the next complete JSON value. A value followed by nothing but
+        the start of a number might be cut off (a number split between two
+        chunks), so more input is read before accepting it
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if _NUMBER_TAIL.match(self.buffer, end) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_array(chunks):
+    """
+    Yield the elements of a JSON array one at a time from an iterable of text
+    or bytes chunks. Stopping early never reads the rest of the input
+    """
+    reader = _Reader(chunks)
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == ",":
+            reader.pos += 1
+        else:
+            reader.expect("]")
+            return
+
+
+def iter_object(chunks, stream_keys=()):
+    """
+    Yield (key, value) pairs for the members of a JSON object from an iterable
+    of chunks. Arrays under the keys in stream_keys are not decoded whole;
+    each of their elements is yielded as its own (key, element) pair instead
+    """
+    reader = _Reader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key in stream_keys and reader.peek() == "[":
+            reader.pos += 1
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield key, reader.value()
+                    if reader.peek() == ",":
+                        reader.pos += 1
+                    else:
+                        reader.expect("]")
+                        break
+        else:
+            yield key, reader.value()
+
+        if reader.peek() == ",":
+            reader.pos += 1
+        else:
+            reader.expect("}")
+            return
+
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    """Yield fixed size chunks read from an open file"""
+    return iter(lambda: f.read(chunk_size), f.read(0))
+
+
+def iter_file_array(filename, chunk_size=CHUNK_SIZE):
+    """Yield the elements of the JSON array stored in a file, one at a time"""
+    with open(filename, 'rb') as f:
+        yield from iter_array(read_chunks(f, chunk_size))
@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+# Conversion of the API's unix times into the local time of each location
+
+# The furthest any time zone is from UTC, in seconds
+MAX_UTC_OFFSET = 14 * 60 * 60
+
+
+@dataclass(slots=True)
+class LocalTimes:
+    """
+    The times of one weather record as wall clock times at its location. The
+    times are naive, so they print the same way local times always have
+    """
+    time: datetime
+    sunrise: object = None
+    sunset: object = None
+
+
+@lru_cache(maxsize=None)
+def tz_for(utc_offset):
+    """Return the fixed time zone utc_offset seconds from UTC, one per offset"""
+    return timezone(timedelta(seconds=utc_offset))
+
+
+def local_datetime(dt, utc_offset=None):
+    """
+    Return the wall clock time at the unix time dt in the time zone utc_offset
+    seconds from UTC, or in the machine's time zone if utc_offset is None
+    """
+    if utc_offset is None:
+        return datetime.fromtimestamp(dt)
+    return datetime.fromtimestamp(dt, tz_for(utc_offset)).replace(tzinfo=None)
+
+
+def record_offset(record, utc_offset=None):
+    """Return utc_offset, or the offset a record carries if it is None"""
+    return getattr(record, "timezone", None) if utc_offset is None else utc_offset
+
+
+def local_times(records, utc_offset=None):
+    """
+    Convert every time of every record to local time in one pass. Records are
+    converted with utc_offset, such as the timezone of the city a forecast is
+    for, or with their own timezone if it is None. Records with neither are
+    given the machine's local time
+    """
+    converted = []
+    for record in records:
+        offset = record_offset(record, utc_offset)
+        sunrise = getattr(record, "sunrise", None)
+        sunset = getattr(record, "sunset", None)
+        converted.append(LocalTimes(
+            local_datetime(record.dt, offset),
+            None if sunrise is None else local_datetime(sunrise, offset).time(),
+            None if sunset is None else local_datetime(sunset, offset).time()))
+    return converted
@@ -1,5 +1,5 @@
-from datetime import datetime
-import helpers
+import profiling
+import render
 
 # Functions related to printing information
 
@@ -67,6 +67,9 @@ def print_info():
         Forecast' option temperature variance is not updated which gives the 
         output of +0.0 and -0.0. 
 
+        Times, sunrise and sunset are given in the local time of the city the
+        weather is for.
+
         Lastly, Sunrise and Sunset does not appear in the output for the 'Get 
         Forecast'.
 
@@ -75,89 +78,11 @@ def print_info():
     """)
 
 
-def print_weather(weather_data_list, name=""):
-    """Take relevant information from data returned by the API and print it"""
-    
-    for data in weather_data_list:
-
-        # Get weather description
-        weather_list = data['weather']
-        weather_desc = weather_list[0]['description']
-
-        # Get cloud coverage
-        cloud_dict = data['clouds']
-        cloud_coverage = cloud_dict['all']
-
-        # Get temp related data
-        temp_dict = data['main']
-        current_temperature = temp_dict['temp']
-        feels_like = temp_dict['feels_like']
-        min_temp = temp_dict['temp_min']
-        max_temp = temp_dict['temp_max']
-        min_var = current_temperature - min_temp
-        max_var = max_temp - current_temperature
-
-        # Get sunrise and sunset times  
-        readable_sunrise = helpers.get_sunrise(data)
-        readable_sunset = helpers.get_sunset(data)
-
-        # Get rainfall if available
-        rainfall = None
-        rain = data.get('rain')
-
-        if rain:
-            rainfall = rain.get('1h')
-            if rainfall is None:
-                rainfall = rain.get('3h')
-        
-        snowfall = None                                                         
-        snow = data.get('snow')                                                 
-                                                                             
-        if snow:                                                                
-            snowfall = snow.get('1h')                                           
-            if snowfall is None:                                                
-                snowfall = snow.get('3h')     
-
-        # Get humidity and visability
-        humidity = temp_dict['humidity']
-        visibility = data.get("visibility")
-
-        # Get wind speed and direction
-        wind_dict = data['wind']
-        wind_speed = wind_dict['speed']
-        wind_direction = wind_dict['deg']
-
-        # Get time of data calculation
-        time_of_calc_unix_UTC = data['dt']
-        readable_time_of_calc = datetime.fromtimestamp(time_of_calc_unix_UTC)
-
-        city_name = data.get("name")
-        if city_name is None:
-            city_name = name
-
-        # Print everything
-        print(f"\nWEATHER for {city_name.upper()} - {readable_time_of_calc}")
-        print("-" * 29)
-   
-        print(f"Date: {datetime.today().date()}") 
-        print(f"Description: {weather_desc}")
-        print(f"Current Temperature: {current_temperature}")
-        print(f"Feels Like: {feels_like}")
-        print(f"Temperature Variance: +{round(max_var, 1)}, -{round(min_var, 1)}")
-        #print(f"Min Temperature: {min_temp}")
-        #print(f"Max Temperature: {max_temp}")
-        print(f"Humidity: {humidity}%")
-        print(f"Wind Speed: {wind_speed}mph")
-        print(f"Wind Direction: {helpers.calculate_wind_direction(wind_direction)}")
-        if rainfall:
-            print(f"Rainfall: {rainfall}mm/h")
-        if snowfall:
-            print(f"Snowfall: {snowfall}mm/h")
-        print(f"Cloud Coverage: {cloud_coverage}%")
-        if visibility:
-            print(f"Visibility: {visibility/1000.0}km")
-        if readable_sunrise:
-            print(f"Sunrise: {readable_sunrise}")
-        if readable_sunset:
-            print(f"Sunset: {readable_sunset}")
-        print("-" * 29)
+def print_weather(records, name="", utc_offset=None):
+    """
+    Print the weather records parsed from data returned by the API. The whole
+    report is rendered into one buffer and written at once, with times in the
+    time zone utc_offset seconds from UTC, or each record's own
+    """
+    with profiling.stage("render"):
+        render.get_renderer("full").write(records, name=name, utc_offset=utc_offset)
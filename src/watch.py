@@ -0,0 +1,131 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import batch
+import client
+import fetch
+
+# Long running mode that follows the current weather of many locations
+
+# OpenWeather recalculates current weather every 10 minutes
+UPDATE_INTERVAL = 10 * 60
+
+# How long after an update is due to ask for it, giving the provider time to
+# publish it, and how long to wait before asking again if it is late. The wait
+# doubles each time the update is still late, up to UPDATE_INTERVAL
+UPDATE_SLACK = 30
+RETRY_DELAY = 60
+
+WORKERS = 4
+
+# The fields compared to decide whether a location's weather has changed
+WATCHED_FIELDS = ("description", "temp", "feels_like", "humidity", "wind_speed",
+                  "wind_deg", "clouds", "rain", "snow", "visibility")
+
+
+def changed(record, previous):
+    """Return True if any watched value differs between two observations"""
+    if previous is None:
+        return True
+    return any(getattr(record, field) != getattr(previous, field)
+               for field in WATCHED_FIELDS)
+
+
+def next_poll_delay(dt, now=None, late=0):
+    """
+    Return how many seconds to wait before asking for the observation that
+    follows one calculated at dt. If that update is already overdue, wait a
+    short while and ask again, backing off exponentially with late, the
+    number of polls in a row that have already found it overdue
+    """
+    now = time.time() if now is None else now
+    due = dt + UPDATE_INTERVAL + UPDATE_SLACK
+    if due > now:
+        return due - now
+    return min(UPDATE_INTERVAL, RETRY_DELAY * 2 ** min(late, 16))
+
+
+def current_settings(load_settings, limiter):
+    """
+    Load the settings for the next poll. Loading is cheap while the settings
+    file is unchanged, and a new API key or zip code takes effect at once.
+    Changing the key replaces the shared client, so the limiter is set again
+    """
+    settings = load_settings()
+    client.get_client(settings).limiter = limiter
+    return settings
+
+
+async def watch_location(load_settings, location, emit, executor, limiter=None):
+    """
+    Follow one location forever. The settings are loaded again before each
+    poll, and each poll goes through request_weather, so a report still fresh
+    in the cache is used without a network call. A poll that fails is
+    reported and tried again later, so one bad response does not stop the
+    location being watched
+    """
+    loop = asyncio.get_running_loop()
+    params = batch.parse_location(location)
+    previous = None
+    late = 0
+
+    while True:
+        try:
+            settings = current_settings(load_settings, limiter)
+            record = await loop.run_in_executor(
+                executor, fetch.request_weather, settings, params)
+        except Exception as e:
+            print(f"Unable to get the weather for {location} ({e!r}), "
+                  f"trying again in {RETRY_DELAY} seconds", file=sys.stderr)
+            record = None
+        if record is None:
+            await asyncio.sleep(RETRY_DELAY)
+            continue
+
+        if changed(record, previous):
+            emit(location, record)
+        previous = record
+        now = time.time()
+        delay = next_poll_delay(record.dt, now, late)
+        late = late + 1 if record.dt + UPDATE_INTERVAL + UPDATE_SLACK <= now else 0
+        await asyncio.sleep(delay)
+
+
+async def watch_all(load_settings, locations, emit, duration=None, workers=WORKERS,
+                    limiter=None):
+    """
+    Watch every location on one event loop. Blocking requests run on a small
+    thread pool that shares the client's pooled connections. Runs until
+    duration seconds have passed, or forever if duration is None. If watching
+    a location fails, the others are stopped and the error is raised
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        tasks = [asyncio.create_task(
+                     watch_location(load_settings, location, emit, executor, limiter))
+                 for location in locations]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=duration,
+                                         return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run(load_settings, locations, emit, duration=None,
+        requests_per_minute=batch.REQUESTS_PER_MINUTE):
+    """
+    Watch the locations, calling emit(location, record) whenever one changes.
+    load_settings is called before every poll and returns the settings to use
+    """
+    limiter = batch.RateLimiter(requests_per_minute)
+    try:
+        asyncio.run(watch_all(load_settings, locations, emit, duration, limiter=limiter))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.get_client().limiter = None